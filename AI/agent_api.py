@@ -1,5 +1,10 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import asyncio
+import json
+import re
 import uvicorn
 import sys
 import os
@@ -7,8 +12,13 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
-from main import generate_response
-from backend.app.database import connect_to_mongo, close_mongo_connection
+from main import generate_response, generate_response_stream, split_sentences, response_cache, model_invoker, model_router, availability_prefetcher, sessions
+import tool_dispatch
+from response_cache import normalize_text
+from single_flight import SingleFlight
+# Import through the same package path the backend services use so the
+# in-process tools share this connection instead of an uninitialized copy.
+from app.database import connect_to_mongo, close_mongo_connection
 
 app = FastAPI(
     title="Meeting Schedule Assistant API",
@@ -17,10 +27,19 @@ app = FastAPI(
 
 class Query(BaseModel):
     input: str
+    session_id: str = "default"
+
+# Device retries and duplicate webhook deliveries share the original's result
+request_coalescer = SingleFlight(window=float(os.getenv("COALESCE_WINDOW", "1.5")))
+# Short answers to a prompt ("yes", "no") are new turns even when they repeat the
+# last one, so they only share a run still in flight
+CONFIRMATION = re.compile(r"(?:yes|yeah|yep|no|nope|sure|ok|okay|confirm|cancel|do it|go ahead)(?: please)?")
 
 @app.on_event("startup")
 async def startup_event():
-    await connect_to_mongo()
+    # The backend owns migrations; running them here too would race it on upgrades
+    await connect_to_mongo(apply_schema=False)
+    tool_dispatch.bind_event_loop(asyncio.get_running_loop())
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -29,10 +48,78 @@ async def shutdown_event():
 @app.post("/get-response")
 async def get_response_api(query: Query):
     try:
-        response_text = generate_response(query.input)
+        # Run off the event loop: the agent blocks on model calls, and
+        # in-process tools schedule their coroutines back onto this loop.
+        text = normalize_text(query.input)
+        response_text = await request_coalescer.run(
+            (query.session_id, text),
+            lambda: run_in_threadpool(generate_response, query.input, query.session_id),
+            window=0 if CONFIRMATION.fullmatch(text) else None
+        )
         return {"response": response_text}
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/get-response/stream")
+async def get_response_stream_api(query: Query):
+    """
+    Stream the reply as server-sent events, one sentence per event.
+
+    Coalesced on the same key as /get-response: the first request streams the
+    reply as it is generated, and duplicates replay its sentences once it is
+    done instead of running the turn (and its tools) again.
+    """
+    loop = asyncio.get_running_loop()
+    sentences = asyncio.Queue()
+    finished = object()
+
+    def produce():
+        reply = []
+        try:
+            for sentence in generate_response_stream(query.input, query.session_id):
+                reply.append(sentence)
+                loop.call_soon_threadsafe(sentences.put_nowait, sentence)
+        finally:
+            loop.call_soon_threadsafe(sentences.put_nowait, finished)
+        return " ".join(reply)
+
+    text = normalize_text(query.input)
+    # The generator runs in the threadpool, keeping the loop free
+    task, joined = request_coalescer.start(
+        (query.session_id, text),
+        lambda: run_in_threadpool(produce),
+        window=0 if CONFIRMATION.fullmatch(text) else None
+    )
+
+    async def event_stream():
+        try:
+            if joined:
+                replayed = split_sentences([await asyncio.shield(task)])
+            else:
+                replayed = []
+                while (sentence := await sentences.get()) is not finished:
+                    yield f"data: {json.dumps({'text': sentence})}\n\n"
+                await asyncio.shield(task)
+            for sentence in replayed:
+                yield f"data: {json.dumps({'text': sentence})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.get("/metrics")
+async def metrics_api():
+    return {
+        "response_cache": response_cache.stats(),
+        "model_calls": model_invoker.stats(),
+        "model_routes": model_router.stats(),
+        "availability_prefetch": availability_prefetcher.stats(),
+        "request_coalescing": request_coalescer.stats(),
+        "sessions": len(sessions)
+    }
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,74 @@
+# Compare prompt size of the verbose and compact tool-output encodings.
+#
+#   python bench_tool_encoding.py            # estimated tokens (chars / 4)
+#   python bench_tool_encoding.py --gemini   # exact counts via the Gemini count_tokens API
+
+import sys
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from context_manager import estimate_tokens
+from tool_encoding import encode_calendar_compact, encode_emails_compact, summarize_calendar, format_emails
+
+def sample_freebusy(days: int = 3) -> dict:
+    """Backend-shaped freebusy payload: a few busy blocks per day, free slots in between."""
+    busy = []
+    start = datetime(2025, 11, 17, 13, 0)  # 8am Eastern in UTC
+    for day in range(days):
+        base = start + timedelta(days=day)
+        for offset_hours, length_minutes in ((1, 30), (1.5, 30), (4, 60), (6, 45)):
+            block_start = base + timedelta(hours=offset_hours)
+            busy.append({
+                "start": block_start.isoformat() + "Z",
+                "end": (block_start + timedelta(minutes=length_minutes)).isoformat() + "Z"
+            })
+
+    free = []
+    last_end = start
+    for period in busy:
+        period_start = datetime.fromisoformat(period["start"][:-1])
+        if period_start > last_end:
+            free.append({"start": last_end.isoformat(), "end": period_start.isoformat()})
+        last_end = datetime.fromisoformat(period["end"][:-1])
+    return {"busy": busy, "free": free}
+
+def sample_emails(count: int = 5) -> dict:
+    snippet = (
+        "Hi, following up on our conversation last week about the quarterly budget review. "
+        "Could we find some time on Thursday or Friday afternoon to go through the numbers "
+        "together? Let me know what works for you and I will send an invite."
+    )
+    return {"emails": [
+        {
+            "id": f"msg{i}",
+            "from": f"Sender {i} <sender{i}@example.com>",
+            "date": f"Mon, 17 Nov 2025 09:{30 + i} -0500",
+            "subject": f"Budget review follow-up #{i}",
+            "snippet": snippet
+        }
+        for i in range(count)
+    ], "count": count}
+
+def main():
+    load_dotenv()
+
+    counter = estimate_tokens
+    if "--gemini" in sys.argv:
+        from google import genai
+        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        counter = lambda text: client.models.count_tokens(model="gemini-2.5-flash", contents=text).total_tokens
+
+    cases = [
+        ("get_current_availability", summarize_calendar(sample_freebusy()), encode_calendar_compact(sample_freebusy())),
+        ("retrieve_email", format_emails(sample_emails()), encode_emails_compact(sample_emails())),
+    ]
+
+    print(f"{'tool':<26}{'verbose':>10}{'compact':>10}{'saved':>9}")
+    for tool, verbose, compact in cases:
+        verbose_tokens = counter(verbose)
+        compact_tokens = counter(compact)
+        saved = 1 - compact_tokens / verbose_tokens
+        print(f"{tool:<26}{verbose_tokens:>10}{compact_tokens:>10}{saved:>9.0%}")
+
+if __name__ == "__main__":
+    main()
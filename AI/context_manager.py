@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Rough chars-per-token ratio for English prompts; close enough for budgeting
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def clip(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + f" … [{len(text) - max_chars} chars truncated]"
+
+
+class ConversationContext:
+    """
+    Conversation history that stays within a token budget.
+
+    Tool outputs are kept verbatim only for the turn that produced them;
+    on later turns they are clipped, and the oldest entries are dropped
+    once the budget is exceeded. The static system prefix is sent first
+    and never changes, so the model can reuse its cached prefix, while
+    per-turn facts such as the current time go in a small trailing part.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 2000,
+        max_entries: int = 10,
+        old_tool_output_chars: int = 240
+    ):
+        self.token_budget = token_budget
+        self.old_tool_output_chars = old_tool_output_chars
+        self.turn = 0
+        # (turn, kind, text) where kind is "user", "assistant" or "tool"
+        self.entries = deque(maxlen=max_entries)
+
+    def add_user(self, text: str):
+        self.turn += 1
+        self.entries.append((self.turn, "user", f"User: {text}"))
+
+    def add_assistant(self, text: str):
+        self.entries.append((self.turn, "assistant", f"Assistant: {text}"))
+
+    def add_tool_output(self, function_name: str, output: str):
+        self.entries.append((self.turn, "tool", f"Function {function_name} output: {output}"))
+
+    def _compacted(self) -> list[str]:
+        history = []
+        for turn, kind, text in self.entries:
+            if kind == "tool" and turn < self.turn:
+                text = clip(text, self.old_tool_output_chars)
+            history.append((turn, text))
+
+        # Drop the oldest entries until we fit, but never the current turn
+        total = sum(estimate_tokens(text) for _, text in history)
+        while history and history[0][0] < self.turn and total > self.token_budget:
+            total -= estimate_tokens(history.pop(0)[1])
+        return [text for _, text in history]
+
+    def build_contents(self, system_instruction: str, *extra_parts: str) -> list[str]:
+        """Assemble the prompt: static prefix, compacted history, then volatile parts."""
+        return [system_instruction] + self._compacted() + list(extra_parts)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SessionStore:
+    """
+    One ConversationContext per session (each device has its own), so
+    concurrent conversations never share history. The least recently used
+    session is dropped beyond max_sessions, and any idle for idle_seconds.
+    """
+
+    def __init__(self, factory, max_sessions: int = 64, idle_seconds: float = 3600):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()   # session_id -> (last_used, context)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ConversationContext:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            context = entry[1] if entry and now - entry[0] < self.idle_seconds else self.factory()
+            self._sessions[session_id] = (now, context)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return context
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,161 @@
+import re
+from datetime import date, datetime, timedelta, time
+from typing import NamedTuple
+import pytz
+from response_cache import normalize_text
+
+# Patterns run on normalize_text() output: lowercase, no punctuation ("what's" -> "what s")
+PREFIX = r"(?:(?:hey|hi|ok|okay) )?(?:bmo )?(?:please )?(?:(?:can|could|would) you )?(?:please )?"
+SUFFIX = r"(?: please| for me| thanks| thank you)*"
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Local hours covered by each part of the day; no part means the whole day
+DAY_PARTS = {
+    "morning": (8, 12),
+    "afternoon": (12, 17),
+    "evening": (17, 21),
+    "night": (17, 23),
+    "tonight": (17, 23),
+}
+
+EMAIL_PATTERN = re.compile(
+    PREFIX
+    + r"(?:"
+    + r"(?:read|check|show|get|tell me|list)(?: me)?(?: my| any| the)?(?: new| unread| latest| recent)? (?:e ?mails?|mail|inbox|messages)"
+    + r"|(?:do i have |did i get |are there |is there )?any (?:new |unread )?(?:e ?mails?|mail|messages)"
+    + r")"
+    + SUFFIX
+)
+
+AVAILABILITY_PATTERN = re.compile(
+    PREFIX
+    + r"(?:"
+    + r"am i (?:free|available|busy)"
+    + r"|do i have (?:any(?:thing)? )?(?:meetings?|events?|plans|anything)(?: scheduled)?"
+    + r"|what (?:s|is) on my (?:calendar|schedule)"
+    + r"|what does my (?:calendar|schedule) look like"
+    + r"|how does my (?:calendar|schedule) look"
+    + r") (?P<when>.+?)"
+    + SUFFIX
+)
+
+WHEN_PATTERN = re.compile(
+    r"(?:(?:on |for )?(?P<day>today|tomorrow|(?:the )?day after tomorrow|(?:next |this )?(?:" + "|".join(WEEKDAYS) + r")))?"
+    r"(?: ?(?:in the |this )?(?P<part>morning|afternoon|evening|night))?"
+    r"|(?P<tonight>tonight)"
+)
+
+
+class RoutedIntent(NamedTuple):
+    tool: str
+    args: dict
+
+
+def resolve_day(day: str | None, now: datetime) -> date:
+    """Turn a relative day expression into a calendar date in the user's timezone."""
+    today = now.date()
+    if day is None or day == "today":
+        return today
+    if day == "tomorrow":
+        return today + timedelta(days=1)
+    if day.endswith("day after tomorrow"):
+        return today + timedelta(days=2)
+
+    is_next = day.startswith("next ")
+    weekday = WEEKDAYS.index(day.split()[-1])
+    days_ahead = (weekday - today.weekday()) % 7
+    if is_next and days_ahead == 0:
+        days_ahead = 7
+    return today + timedelta(days=days_ahead)
+
+
+def parse_when(text: str, now: datetime) -> tuple[datetime, datetime] | None:
+    """Parse "tomorrow afternoon", "this evening", "next friday" into a local time range."""
+    match = WHEN_PATTERN.fullmatch(text)
+    if not match or not any(match.groupdict().values()):
+        return None
+
+    tz = now.tzinfo
+    if match.group("tonight"):
+        day, part = "today", "tonight"
+    else:
+        day, part = match.group("day"), match.group("part")
+    day_date = resolve_day(day, now)
+
+    if part:
+        start_hour, end_hour = DAY_PARTS[part]
+        start = tz.localize(datetime.combine(day_date, time(start_hour)))
+        end = tz.localize(datetime.combine(day_date, time(end_hour)))
+    else:
+        start = tz.localize(datetime.combine(day_date, time(0)))
+        end = tz.localize(datetime.combine(day_date, time(23, 59, 59)))
+
+    # A window that has already ended is left to the model
+    if end <= now:
+        return None
+    # Skip the part of today that has already passed; whole hours keep cache keys stable
+    if start < now < end:
+        start = now.replace(minute=0, second=0, microsecond=0)
+    return start, end
+
+
+DAY_EXPRESSION = re.compile(
+    r"\b(today|tonight|tomorrow|(?:the )?day after tomorrow|(?:this|next) week"
+    r"|(?:next |this )?(?:" + "|".join(WEEKDAYS) + r"))\b"
+)
+
+def find_date_range(text: str, now: datetime) -> tuple[datetime, datetime] | None:
+    """
+    Loosely find every day mentioned anywhere in free text and return one
+    local range covering all of them, or None if no day is mentioned.
+    """
+    dates = []
+    for match in DAY_EXPRESSION.finditer(normalize_text(text)):
+        expression = match.group(1)
+        if expression == "tonight":
+            expression = "today"
+        if expression == "this week":
+            dates += [now.date(), now.date() + timedelta(days=6 - now.weekday())]
+        elif expression == "next week":
+            monday = now.date() + timedelta(days=7 - now.weekday())
+            dates += [monday, monday + timedelta(days=6)]
+        else:
+            dates.append(resolve_day(expression, now))
+    if not dates:
+        return None
+
+    tz = now.tzinfo
+    start = tz.localize(datetime.combine(min(dates), time(0)))
+    end = tz.localize(datetime.combine(max(dates), time(23, 59, 59)))
+    if start < now:
+        start = now.replace(minute=0, second=0, microsecond=0)
+    return start, end
+
+
+def to_utc_string(dt: datetime) -> str:
+    return dt.astimezone(pytz.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def route_intent(user_input: str, now: datetime) -> RoutedIntent | None:
+    """
+    Map common requests straight to a tool call without asking the model.
+    `now` must be timezone-aware in the user's timezone. Returns None when
+    the request is not an exact fit, so the full agent handles it.
+    """
+    text = normalize_text(user_input)
+
+    if EMAIL_PATTERN.fullmatch(text):
+        return RoutedIntent("retrieve_email", {})
+
+    match = AVAILABILITY_PATTERN.fullmatch(text)
+    if match:
+        when = parse_when(match.group("when"), now)
+        if when:
+            start, end = when
+            return RoutedIntent("get_current_availability", {
+                "start_range": to_utc_string(start),
+                "end_range": to_utc_string(end)
+            })
+
+    return None
@@ -2,70 +2,185 @@ from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 import os
-from collections import deque
+import re
+import json
+import threading
+import time
+from contextvars import ContextVar
 from datetime import datetime
 import pytz
-import requests
+from typing import NamedTuple
+import tool_dispatch
+from context_manager import ConversationContext, SessionStore
+from response_cache import ResponseCache, normalize_text
+from intent_router import RoutedIntent, route_intent
+from model_invoker import ModelInvoker, TurnDeadline
+from prefetch import AvailabilityPrefetcher, clip_freebusy, parse_utc
+from tool_encoding import encoding_for, encode_calendar_compact, encode_emails_compact, summarize_calendar, format_emails
 
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 google_id = os.getenv("GOOGLE_ID")
 client = genai.Client(api_key=api_key)
 
-# -------- Start Tools Functions ----------- #
-
-def summarize_calendar(data, timezone="US/Eastern"):
-    def fmt(dt_str):
-        dt = datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
-        local_dt = dt.astimezone(pytz.timezone(timezone))
-        return local_dt.strftime("%a, %b %d, %Y %I:%M %p")
+# Every turn must finish within TURN_DEADLINE seconds; slow calls are hedged
+# and fall back to the lighter model as the deadline gets close
+TURN_DEADLINE = float(os.getenv("MODEL_TURN_DEADLINE", "20"))
+model_invoker = ModelInvoker(
+    client,
+    fallback_model=os.getenv("MODEL_FALLBACK", "gemini-2.5-flash-lite"),
+    hedge_after=float(os.environ["MODEL_HEDGE_AFTER"]) if os.getenv("MODEL_HEDGE_AFTER") else None,
+    fallback_margin=float(os.getenv("MODEL_FALLBACK_MARGIN", "4")),
+    max_retries=int(os.getenv("MODEL_MAX_RETRIES", "2")),
+    backoff=float(os.getenv("MODEL_RETRY_BACKOFF", "0.5"))
+)
 
-    summary = []
+# -------- Model Routing ----------- #
+
+# Model per route. A route is "<step>:<complexity>" or just "<step>"; the more
+# specific one wins. Override any entry with MODEL_MAP='{"final_phrasing": "..."}'.
+MODEL_MAP = {
+    "tool_selection:simple": "gemini-2.5-flash-lite",
+    "tool_selection:standard": "gemini-2.5-flash",
+    "tool_selection:complex": "gemini-2.5-flash",
+    "email_analysis": "gemini-2.5-flash",
+    "final_phrasing": "gemini-2.5-flash-lite",
+    "final_phrasing:complex": "gemini-2.5-flash",
+}
+MODEL_MAP.update(json.loads(os.getenv("MODEL_MAP", "{}")))
+
+SMALL_TALK = re.compile(r"(?:hi|hello|hey|thanks|thank you|ok|okay|cool|great|bye|goodbye|good (?:morning|night))(?: bmo)?")
+SCHEDULING_WORDS = re.compile(r"\b(?:schedule|reschedule|meeting|meet|book|invite|availability|available)\b")
+EMAIL_WORDS = re.compile(r"\b(?:e-?mail|send|reply|forward)\b")
+
+def classify_turn(user_input: str) -> str:
+    """Rough complexity of a turn: simple, standard, complex, or email_analysis for webhook prompts."""
+    text = user_input.strip().lower()
+    if text.startswith("you received a new email"):
+        return "email_analysis"
+    if SMALL_TALK.fullmatch(normalize_text(text)):
+        return "simple"
+    # Scheduling that also involves emailing people is a multi-step negotiation
+    if SCHEDULING_WORDS.search(text) and (EMAIL_WORDS.search(text) or "@" in text or len(text) > 300):
+        return "complex"
+    return "standard"
+
+class ModelRouter:
+    """Pick a model per route and keep per-route call, latency and token totals."""
+
+    def __init__(self, model_map: dict, invoker: ModelInvoker):
+        self.model_map = model_map
+        self.invoker = invoker
+        self._lock = threading.Lock()
+        self.accounting = {}
+
+    def route_for(self, step: str, complexity: str) -> str:
+        if complexity == "email_analysis" and step == "tool_selection":
+            return "email_analysis"
+        route = f"{step}:{complexity}"
+        return route if route in self.model_map else step
+
+    def model_for(self, route: str) -> str:
+        return self.model_map.get(route, "gemini-2.5-flash")
+
+    def generate(self, step: str, complexity: str, contents, config=None, deadline: TurnDeadline | None = None):
+        route = self.route_for(step, complexity)
+        started = time.monotonic()
+        response = self.invoker.generate(model=self.model_for(route), contents=contents, config=config, deadline=deadline)
+        self._account(route, started, getattr(response, "usage_metadata", None))
+        return response
+
+    def stream(self, step: str, complexity: str, contents, config=None, deadline: TurnDeadline | None = None):
+        """Streaming generate; the call is accounted once the stream ends, with the last chunk's usage."""
+        route = self.route_for(step, complexity)
+        started = time.monotonic()
+        usage = None
+        for chunk in self.invoker.stream(model=self.model_for(route), contents=contents, config=config, deadline=deadline):
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            yield chunk
+        self._account(route, started, usage)
+
+    def _account(self, route: str, started: float, usage):
+        with self._lock:
+            totals = self.accounting.setdefault(route, {
+                "model": self.model_for(route), "calls": 0, "latency_s": 0.0, "prompt_tokens": 0, "output_tokens": 0
+            })
+            totals["calls"] += 1
+            totals["latency_s"] += time.monotonic() - started
+            if usage:
+                totals["prompt_tokens"] += usage.prompt_token_count or 0
+                totals["output_tokens"] += usage.candidates_token_count or 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                route: dict(totals, avg_latency_s=totals["latency_s"] / totals["calls"])
+                for route, totals in self.accounting.items()
+            }
 
-    if "free" in data and data["free"]:
-        summary.append("Free Times:")
-        for slot in data["free"]:
-            summary.append(f"  - {fmt(slot['start'])} → {fmt(slot['end'])}")
+model_router = ModelRouter(MODEL_MAP, model_invoker)
 
-    if "busy" in data and data["busy"]:
-        summary.append("Busy Times:")
-        for slot in data["busy"]:
-            summary.append(f"  - {fmt(slot['start'])} → {fmt(slot['end'])}")
+# -------- Start Tools Functions ----------- #
 
-    return "\n".join(summary)
+# Digests the backend precomputes are trusted up to this age, in seconds
+DIGEST_MAX_AGE = float(os.getenv("DIGEST_MAX_AGE", "900"))
+# Wall-clock time of the agent's last write per domain; older digests are stale
+last_write_at = {}
+
+# The digest is re-read at most this often, so turns it can't serve mostly skip the extra round trip
+DIGEST_CACHE_SECONDS = float(os.getenv("DIGEST_CACHE_SECONDS", "15"))
+_digest_cache = {"fetched_at": None, "digest": None}
+_digest_lock = threading.Lock()
+
+def cached_digest() -> tuple:
+    """The user's digest (or None) and the seconds since it was fetched."""
+    with _digest_lock:
+        fetched_at = _digest_cache["fetched_at"]
+        if fetched_at is None or time.monotonic() - fetched_at > DIGEST_CACHE_SECONDS:
+            _digest_cache["digest"] = tool_dispatch.fetch_digest(str(google_id))
+            _digest_cache["fetched_at"] = fetched_at = time.monotonic()
+        return _digest_cache["digest"], time.monotonic() - fetched_at
+
+def fresh_digest_part(part: str, domain: str) -> dict | None:
+    """Return the "agenda" or "mail" part of the user's digest if it is still current."""
+    digest, held_for = cached_digest()
+    if not digest or not digest.get(part):
+        return None
+    age = digest.get(f"{part}_age_seconds")
+    if age is None:
+        return None
+    age += held_for
+    if age > DIGEST_MAX_AGE or age > time.time() - last_write_at.get(domain, 0):
+        return None
+    return digest[part]
 
 def get_current_availability(start_range: str, end_range: str) -> str:
     print(start_range, end_range)
-    availability = requests.get(
-        "http://localhost:8000/api/calendar/freebusy",
-            params={
-                "google_id": google_id,
-                "start_range": start_range,
-                "end_range": end_range
-            }
-        ).json()
+    # Served from the speculative prefetch when it covers the requested range
+    availability = availability_prefetcher.lookup(start_range, end_range, active_session.get())
+    if availability is None:
+        agenda = fresh_digest_part("agenda", "calendar")
+        if agenda and parse_utc(agenda["start_range"]) <= parse_utc(start_range) and parse_utc(end_range) <= parse_utc(agenda["end_range"]):
+            availability = clip_freebusy(agenda, parse_utc(start_range), parse_utc(end_range))
+    if availability is None:
+        availability = tool_dispatch.fetch_freebusy(str(google_id), start_range, end_range)
     print(availability)
+    if availability is None:
+        return "Failed to retrieve availability."
+    if encoding_for("get_current_availability") == "compact":
+        return encode_calendar_compact(availability, USER_TIMEZONE)
     return summarize_calendar(availability)
 
 def send_email(recipient: str, subject: str, body: str) -> str:
-    url = "http://localhost:8000/api/gmail/send"
-
-    params = {
-        "google_id": str(google_id)
-    }
-    payload = {
-        "to": recipient,
-        "subject": subject,
-        "body": body
-    }
-
-    response = requests.post(url, params=params, json=payload)
-    return f"Email sent to {recipient} with subject '{subject}'." if response.status_code == 200 else "Failed to send email."
+    try:
+        result = tool_dispatch.send_email(str(google_id), recipient, subject, body)
+    except tool_dispatch.OutcomeUnknown:
+        return f"Unconfirmed: the email to {recipient} may or may not have been sent. Do not resend it without asking."
+    return f"Email sent to {recipient} with subject '{subject}'." if result is not None else "Failed to send email."
     
 def setup_meeting(summary: str, description: str, start_time: str, end_time: str) -> str:
     USER_TIMEZONE = "US/Eastern"  # Amherst, MA timezone
     
-    params = {"google_id": str(google_id)}
     data = {
         "summary": summary,
         "description": description,
@@ -75,40 +190,97 @@ def setup_meeting(summary: str, description: str, start_time: str, end_time: str
     }
     print(f"Setting up meeting in {USER_TIMEZONE}: {data}")
 
-    response = requests.post("http://127.0.0.1:8000/api/calendar/create", params=params, json=data)
-    print(response)
-    return f"Meeting scheduled successfully from {start_time} to {end_time}." if response.status_code == 200 else "Failed to schedule meeting."
-
-def format_emails(data):
-    emails = data.get('emails', [])
-    result = []
-
-    for i, email in enumerate(emails, start=1):
-        email_str = (
-            f"Email {i}\n"
-            f"From: {email.get('from')}, Date: {email.get('date')}\n"
-            f"Subject: {email.get('subject')}\n"
-            f"Snippet: {email.get('snippet')}\n"
-        )
-        result.append(email_str)
-
-    return "\n".join(result)
-
-def retrieve_email() -> str:
-    url = "http://localhost:8000/api/gmail/unread"
+    try:
+        created_event = tool_dispatch.create_event(str(google_id), data)
+    except tool_dispatch.OutcomeUnknown:
+        return "Unconfirmed: the meeting may or may not have been created. Do not create it again without asking."
+    print(created_event)
+    return f"Meeting scheduled successfully from {start_time} to {end_time}." if created_event is not None else "Failed to schedule meeting."
 
-    params = {
-        "google_id": str(google_id),
-        "max_results": 5,
-        "mark_as_read": False
+def book_meeting(summary: str, description: str, start_time: str, end_time: str) -> str:
+    data = {
+        "summary": summary,
+        "description": description,
+        "start_time": start_time,
+        "end_time": end_time,
+        "timezone": USER_TIMEZONE
     }
+    try:
+        result = tool_dispatch.book_event(str(google_id), data)
+    except tool_dispatch.OutcomeUnknown:
+        return "Unconfirmed: the meeting may or may not have been booked. Do not book it again without asking."
+    if result is None:
+        return "Failed to book meeting."
+    if result.get("status") == "booked":
+        start = fmt_meeting_time(start_time)
+        end = fmt_meeting_time(end_time, with_date=False)
+        return f"Your meeting \"{summary}\" is booked for {start} to {end}."
+
+    alternatives = [fmt_meeting_time(slot["start"]) for slot in result.get("alternatives", [])]
+    if not alternatives:
+        return "That time is already taken, and I couldn't find another free slot nearby."
+    return f"That time is already taken. The nearest free times are {', or '.join(alternatives)}. Which would you like?"
 
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return format_emails(response.json())
+def retrieve_email() -> str:
+    emails = fresh_digest_part("mail", "mail")
+    if emails is None:
+        emails = tool_dispatch.fetch_unread(str(google_id), max_results=5, mark_as_read=False)
+    if emails is not None:
+        if encoding_for("retrieve_email") == "compact":
+            return encode_emails_compact(emails)
+        return format_emails(emails)
     else:
         return "Failed to retrieve emails."
 
+SEARCH_TOP_K = int(os.getenv("MAIL_SEARCH_TOP_K", "5"))
+
+def search_email(query: str) -> str:
+    # Only the top hits go into the prompt, never whole mailboxes
+    results = tool_dispatch.search_mail(str(google_id), query, top_k=SEARCH_TOP_K)
+    if results is None:
+        return "Failed to search emails."
+    if not results.get("hits"):
+        return f"No emails match \"{query}\"."
+    emails = {"emails": results["hits"]}
+    if encoding_for("search_email") == "compact":
+        return encode_emails_compact(emails, max_items=SEARCH_TOP_K, snippet_chars=160)
+    return format_emails(emails)
+
+def fmt_meeting_time(time_str: str, with_date: bool = True) -> str:
+    dt = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
+    return dt.strftime("%a, %b %d at %I:%M %p" if with_date else "%I:%M %p")
+
+def send_email_reply(args: dict, output: str) -> str:
+    if output.startswith("Failed"):
+        return "Sorry, I couldn't send that email."
+    if output.startswith("Unconfirmed"):
+        return "I couldn't confirm that the email went out. Please check your sent mail before I send it again."
+    return f"Done, I sent the email to {args['recipient']} with the subject \"{args['subject']}\"."
+
+def setup_meeting_reply(args: dict, output: str) -> str:
+    if output.startswith("Failed"):
+        return "Sorry, I couldn't schedule that meeting."
+    if output.startswith("Unconfirmed"):
+        return "I couldn't confirm that the meeting was created. Please check your calendar before I try again."
+    start = fmt_meeting_time(args["start_time"])
+    end = fmt_meeting_time(args["end_time"], with_date=False)
+    return f"Your meeting \"{args['summary']}\" is scheduled for {start} to {end}."
+
+def book_meeting_reply(args: dict, output: str) -> str:
+    # book_meeting already phrases both the booking and the alternatives
+    if output.startswith("Failed"):
+        return "Sorry, I couldn't book that meeting."
+    if output.startswith("Unconfirmed"):
+        return "I couldn't confirm that the meeting was booked. Please check your calendar before I try again."
+    return output
+
+# Tools whose result is a fixed confirmation; replying from these skips the follow-up model call
+RESPONSE_TEMPLATES = {
+    "send_email": send_email_reply,
+    "setup_meeting": setup_meeting_reply,
+    "book_meeting": book_meeting_reply,
+}
+
 get_availability_tool = types.Tool(
     function_declarations=[
         types.FunctionDeclaration(
@@ -151,6 +323,25 @@ setup_meeting_tool = types.Tool(
     ]
 )
 
+book_meeting_tool = types.Tool(
+    function_declarations=[
+        types.FunctionDeclaration(
+            name="book_meeting",
+            description="Book a meeting at a specific time in one step: creates the calendar event only if the slot is free, otherwise returns the nearest free alternative times. Provide times in US/Eastern timezone format 'YYYY-MM-DDTHH:MM:SS' (without Z).",
+            parameters={
+                "type": "object",
+                "properties": {
+                    "summary": {"type": "string", "description": "Summary or title of the meeting."},
+                    "description": {"type": "string", "description": "Description or agenda of the meeting."},
+                    "start_time": {"type": "string", "description": "Start time in US/Eastern timezone format: 'YYYY-MM-DDTHH:MM:SS' (e.g., '2025-01-15T14:00:00' for 2pm Eastern)."},
+                    "end_time": {"type": "string", "description": "End time in US/Eastern timezone format: 'YYYY-MM-DDTHH:MM:SS' (e.g., '2025-01-15T14:30:00' for 2:30pm Eastern)."}
+                },
+                "required": ["summary", "description", "start_time", "end_time"]
+            }
+        )
+    ]
+)
+
 send_email_tool = types.Tool(
     function_declarations=[
         types.FunctionDeclaration(
@@ -184,19 +375,48 @@ retrieve_email_tool = types.Tool(
     ]
 )
 
+search_email_tool = types.Tool(
+    function_declarations=[
+        types.FunctionDeclaration(
+            name="search_email",
+            description="Search all of the user's emails (read or unread) and return the best matching few. Supports 'from:name' and 'subject:word' filters inside the query.",
+            parameters={
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Keywords to search for, e.g. 'from:alice budget review'."}
+                },
+                "required": ["query"]
+            }
+        )
+    ]
+)
+
 config = types.GenerateContentConfig(
-    tools=[get_availability_tool, setup_meeting_tool, send_email_tool, retrieve_email_tool]
+    tools=[get_availability_tool, setup_meeting_tool, book_meeting_tool, send_email_tool, retrieve_email_tool, search_email_tool]
 )
 
 # -------- End Tools Functions ----------- #
 
 MAX_HISTORY = 10
-conversation_history = deque(maxlen=MAX_HISTORY)
+# Token budget for the history part of the prompt (the system prefix is fixed)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Each session (the backend uses one per device) keeps its own conversation
+sessions = SessionStore(
+    lambda: ConversationContext(token_budget=CONTEXT_TOKEN_BUDGET, max_entries=MAX_HISTORY),
+    max_sessions=int(os.getenv("MAX_SESSIONS", "64")),
+    idle_seconds=float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+)
+# Session of the tool call in progress, for tools that keep per-session state
+active_session = ContextVar("active_session", default="default")
 
 # Amherst, MA is in US/Eastern timezone
 USER_TIMEZONE = "US/Eastern"
 local_tz = pytz.timezone(USER_TIMEZONE)
-local_time = datetime.now(local_tz)
+
+def current_time_part() -> str:
+    """Per-turn time note, kept out of system_instruction so that prefix never changes."""
+    local_time = datetime.now(local_tz)
+    return "Current local time (US/Eastern): " + local_time.strftime("%Y-%m-%d %H:%M:%S %Z")
 
 system_instruction = """
 You are a virtual scheduling assistant. You can perform two types of tasks: sending emails and scheduling meetings.
@@ -204,8 +424,8 @@ You are a virtual scheduling assistant. You can perform two types of tasks: send
 **IMPORTANT TIMEZONE INFORMATION:**
 - The user is located in Amherst, MA, USA (US/Eastern timezone).
 - When the user says a time like "2pm" or "2:30pm", they mean that time in US/Eastern timezone.
-- Current local time (US/Eastern): """ + local_time.strftime("%Y-%m-%d %H:%M:%S %Z") + """
-- When calling `setup_meeting`, you should provide times in the format 'YYYY-MM-DDTHH:MM:SS' (without Z) representing the local time in US/Eastern.
+- The current local time (US/Eastern) is given in the note at the end of the conversation.
+- When calling `setup_meeting` or `book_meeting`, you should provide times in the format 'YYYY-MM-DDTHH:MM:SS' (without Z) representing the local time in US/Eastern.
 - The function will automatically handle the timezone conversion.
 
 Rules:
@@ -214,13 +434,15 @@ Rules:
    - If the user asks you to send an email, do so using the `send_email` function.
    - After sending an email, confirm to the user that the email has been sent.
    - Do **not** suggest or ask about setting up a meeting unless explicitly instructed.
+   - To find an older or specific email (e.g. "the email from Alice about the budget"), use `search_email`; `retrieve_email` only lists new unread mail.
 
 2. **Scheduling meetings**:
-   - Only if the user explicitly asks to schedule a meeting, check the user's availability using the `get_current_availability` function before proposing any times.
+   - If the user asks to schedule a meeting at a specific time, book it directly with the `book_meeting` function; it checks availability itself and returns alternatives if the time is taken.
+   - Only if the user explicitly asks to schedule a meeting without a specific time, check the user's availability using the `get_current_availability` function before proposing any times.
    - Only after confirming an available time should you schedule the meeting using the `setup_meeting` function.
    - **CRITICAL**: When the user says a time like "2pm", interpret it as 2pm US/Eastern time. Convert it to the format 'YYYY-MM-DDTHH:MM:SS' (e.g., '2025-01-15T14:00:00' for 2pm Eastern on Jan 15, 2025).
    - If the proposed time conflicts with the user's availability, suggest alternative times based on their availability and confirm with the user before scheduling.
-    3. The current date and time is: """ + local_time.strftime("%Y-%m-%d %H:%M:%S %Z") + """. Imply user's query word like today, tomorrow, next week based on this current date.
+    3. The current date and time is given in the "Current local time" note at the end of the conversation. Imply user's query word like today, tomorrow, next week based on this current date.
 4. Always respond politely to the user.  
 5. Never reference yourself as an AI or mention limitations.  
 6. Only take actions necessary for the user's request; do not provide unrelated commentary.
@@ -228,39 +450,210 @@ Rules:
 """
 
 
-def generate_response(user_input: str):
-    conversation_history.append(f"User: {user_input}")
+# Data domain each tool reads or writes, used to version cached replies
+READ_ONLY_TOOLS = {"get_current_availability": "calendar", "retrieve_email": "mail", "search_email": "mail"}
+WRITE_TOOLS = {"send_email": "mail", "setup_meeting": "calendar", "book_meeting": "calendar"}
 
-    contents = [system_instruction] + list(conversation_history)
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "128")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+)
+
+availability_prefetcher = AvailabilityPrefetcher(
+    lambda start_range, end_range: tool_dispatch.fetch_freebusy(str(google_id), start_range, end_range)
+)
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
+def response_cache_key(user_input: str, intent: RoutedIntent | None) -> tuple | None:
+    """
+    Only routed intents are cached: they stand on their own, while free-form
+    turns like "what about friday?" or "yes" mean something different in
+    each conversation.
+    """
+    if intent is None:
+        return None
+    return ResponseCache.make_key(intent.tool, **intent.args)
+
+def cached_reply(cache_key: tuple | None) -> str | None:
+    if cache_key is None:
+        return None
+    # Changes made outside the agent show up as new digest versions: mail through
+    # the backend webhook, calendar edits through the periodic agenda refresh
+    digest, _ = cached_digest()
+    response_cache.observe("mail", digest.get("mail_version") if digest else None)
+    response_cache.observe("calendar", digest.get("agenda_version") if digest else None)
+    return response_cache.get(cache_key)
+
+def intent_call(intent: RoutedIntent) -> types.FunctionCall:
+    return types.FunctionCall(name=intent.tool, args=intent.args)
+
+def cache_reply(cache_key: tuple | None, results: list, reply: str):
+    """Cache a reply only if the turn read data and changed nothing."""
+    tools_used = [result.name for result in results]
+    if cache_key is not None and tools_used and all(name in READ_ONLY_TOOLS for name in tools_used):
+        response_cache.put(cache_key, {READ_ONLY_TOOLS[name] for name in tools_used}, reply)
+
+class ToolResult(NamedTuple):
+    name: str
+    args: dict
+    output: str
+
+def run_tool(function_name: str, args: dict, session_id: str) -> ToolResult | None:
+    """Run one tool and record its output in the session's history. Returns None if it doesn't exist."""
+    tool_function = globals().get(function_name)
+    if not tool_function:
+        print(f"Tool {function_name} not found.")
+        return None
+
+    token = active_session.set(session_id)
+    try:
+        function_output = tool_function(**args)
+    finally:
+        active_session.reset(token)
+    sessions.get(session_id).add_tool_output(function_name, function_output)
+    if function_name in WRITE_TOOLS:
+        response_cache.bump(WRITE_TOOLS[function_name])
+        last_write_at[WRITE_TOOLS[function_name]] = time.time()
+    return ToolResult(function_name, args, function_output)
+
+def run_function_calls(function_calls, session_id: str) -> list:
+    """Execute the model's requested tools and record their outputs in the session's history."""
+    results = [run_tool(func_call.name, dict(func_call.args), session_id) for func_call in function_calls]
+    return [result for result in results if result is not None]
+
+def template_reply(results: list) -> str | None:
+    """Build the reply without the model when every tool result has a template."""
+    if not results or not all(result.name in RESPONSE_TEMPLATES for result in results):
+        return None
+    return " ".join(RESPONSE_TEMPLATES[result.name](result.args, result.output) for result in results)
+
+def generate_response(user_input: str, session_id: str = "default"):
+    conversation_history = sessions.get(session_id)
+    # Common requests map straight to a tool, skipping the tool-selection call
+    intent = route_intent(user_input, datetime.now(local_tz))
+    cache_key = response_cache_key(user_input, intent)
+    cached = cached_reply(cache_key)
+    conversation_history.add_user(user_input)
+    if cached is not None:
+        conversation_history.add_assistant(cached)
+        return cached
+
+    deadline = TurnDeadline(TURN_DEADLINE)
+    complexity = classify_turn(user_input)
+    if intent is not None:
+        results = run_function_calls([intent_call(intent)], session_id)
+    else:
+        # Overlap the likely freebusy lookup with the tool-selection call
+        availability_prefetcher.maybe_start(user_input, datetime.now(local_tz), session_id)
+        try:
+            contents = conversation_history.build_contents(system_instruction, current_time_part())
+
+            response = model_router.generate(
+                "tool_selection", complexity,
+                contents=contents,
+                config=config,
+                deadline=deadline
+            )
+
+            if not response.function_calls:
+                conversation_history.add_assistant(response.text)
+                return response.text
+
+            results = run_function_calls(response.function_calls, session_id)
+        finally:
+            availability_prefetcher.cancel(session_id)
+
+    templated = template_reply(results)
+    if templated is not None:
+        conversation_history.add_assistant(templated)
+        return templated
+
+    contents = conversation_history.build_contents(system_instruction, current_time_part())
+    final_response = model_router.generate(
+        "final_phrasing", complexity,
         contents=contents,
-        config=config
+        deadline=deadline
     )
-
-    if response.function_calls:
-        for func_call in response.function_calls:
-            function_name = func_call.name
-            args = dict(func_call.args)
-            
-            tool_function = globals().get(function_name)
-            if tool_function:
-                function_output = tool_function(**args)
-                conversation_history.append(f"Function {function_name} output: {function_output}")
-            else:
-                print(f"Tool {function_name} not found.")
-
-        contents = [system_instruction] + list(conversation_history)
-        final_response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=contents
+    conversation_history.add_assistant(final_response.text)
+    cache_reply(cache_key, results, final_response.text)
+    return final_response.text
+
+# Split after sentence punctuation or at line breaks
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def split_sentences(text_stream):
+    """Regroup streamed text fragments into whole sentences."""
+    buffer = ""
+    for fragment in text_stream:
+        buffer += fragment
+        parts = SENTENCE_BOUNDARY.split(buffer)
+        for sentence in parts[:-1]:
+            if sentence.strip():
+                yield sentence.strip()
+        buffer = parts[-1]
+    if buffer.strip():
+        yield buffer.strip()
+
+def generate_response_stream(user_input: str, session_id: str = "default"):
+    """
+    Streaming variant of generate_response.
+    Yields the reply sentence by sentence as the model produces it.
+    """
+    conversation_history = sessions.get(session_id)
+    intent = route_intent(user_input, datetime.now(local_tz))
+    cache_key = response_cache_key(user_input, intent)
+    cached = cached_reply(cache_key)
+    conversation_history.add_user(user_input)
+    if cached is not None:
+        conversation_history.add_assistant(cached)
+        yield from split_sentences([cached])
+        return
+
+    deadline = TurnDeadline(TURN_DEADLINE)
+    complexity = classify_turn(user_input)
+    contents = conversation_history.build_contents(system_instruction, current_time_part())
+    function_calls = [intent_call(intent)] if intent is not None else []
+    reply = []
+
+    def first_pass():
+        for chunk in model_router.stream(
+            "tool_selection", complexity,
+            contents=contents,
+            config=config,
+            deadline=deadline
+        ):
+            if chunk.function_calls:
+                function_calls.extend(chunk.function_calls)
+            elif chunk.text:
+                yield chunk.text
+
+    if intent is None:
+        availability_prefetcher.maybe_start(user_input, datetime.now(local_tz), session_id)
+    try:
+        if intent is None:
+            for sentence in split_sentences(first_pass()):
+                reply.append(sentence)
+                yield sentence
+        results = run_function_calls(function_calls, session_id) if function_calls else []
+    finally:
+        availability_prefetcher.cancel(session_id)
+    templated = template_reply(results)
+    if templated is not None:
+        for sentence in split_sentences([templated]):
+            reply.append(sentence)
+            yield sentence
+    elif function_calls:
+        contents = conversation_history.build_contents(system_instruction, current_time_part())
+        final_stream = model_router.stream(
+            "final_phrasing", complexity,
+            contents=contents,
+            deadline=deadline
         )
-        conversation_history.append(f"Assistant: {final_response.text}")
-        return final_response.text
-    else:
-        conversation_history.append(f"Assistant: {response.text}")
-        return response.text
+        for sentence in split_sentences(chunk.text for chunk in final_stream if chunk.text):
+            reply.append(sentence)
+            yield sentence
+
+    conversation_history.add_assistant(" ".join(reply))
+    cache_reply(cache_key, results, " ".join(reply))
 
 if __name__ == "__main__":
     while True:
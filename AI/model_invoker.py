@@ -0,0 +1,202 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+
+
+class TurnDeadline:
+    """Time budget shared by every model call made while answering one turn."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+class ModelInvoker:
+    """
+    Calls generate_content within a turn deadline.
+
+    A call that runs longer than the model's observed p95 (or a fixed
+    hedge_after) gets a duplicate request, and once the deadline is close
+    a request to the lighter fallback model joins the race; the first
+    answer wins. Failed calls are retried with jittered exponential
+    backoff while time remains.
+    """
+
+    def __init__(
+        self,
+        client,
+        fallback_model: str | None = None,
+        hedge_after: float | None = None,
+        fallback_margin: float = 4.0,
+        max_retries: int = 2,
+        backoff: float = 0.5,
+        min_samples: int = 20,
+        max_workers: int = 16
+    ):
+        self.client = client
+        self.fallback_model = fallback_model
+        self.hedge_after = hedge_after
+        self.fallback_margin = fallback_margin
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.min_samples = min_samples
+        # Hedged and abandoned requests keep running in the pool until they return
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-call")
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(lambda: deque(maxlen=200))
+        self.outcomes = Counter()
+
+    def _record(self, outcome: str):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def _timed_call(self, model: str, contents, config):
+        started = time.monotonic()
+        response = self.client.models.generate_content(model=model, contents=contents, config=config)
+        with self._lock:
+            self.latencies[model].append(time.monotonic() - started)
+        return response
+
+    def percentile(self, model: str, fraction: float) -> float | None:
+        with self._lock:
+            samples = sorted(self.latencies[model])
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def hedge_delay(self, model: str) -> float | None:
+        if self.hedge_after is not None:
+            return self.hedge_after
+        return self.percentile(model, 0.95)
+
+    def _race(self, model: str, contents, config, deadline: TurnDeadline):
+        """Run the primary request plus any hedge/fallback requests; return (response, winner)."""
+        now = time.monotonic()
+        launches = []
+        hedge_delay = self.hedge_delay(model)
+        if hedge_delay is not None:
+            launches.append((now + hedge_delay, model, "hedge"))
+        if self.fallback_model and self.fallback_model != model:
+            launches.append((deadline.expires_at - self.fallback_margin, self.fallback_model, "fallback"))
+        launches.sort()
+
+        pending = {self._executor.submit(self._timed_call, model, contents, config): "primary"}
+        error = None
+        while pending:
+            next_launch = launches[0][0] if launches else deadline.expires_at
+            timeout = max(0.0, min(next_launch, deadline.expires_at) - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                winner = pending.pop(future)
+                try:
+                    return future.result(), winner
+                except Exception as e:
+                    error = e
+
+            if deadline.remaining() <= 0:
+                raise TimeoutError("Model call exceeded the turn deadline.")
+            if launches and time.monotonic() >= launches[0][0]:
+                _, launch_model, label = launches.pop(0)
+                pending[self._executor.submit(self._timed_call, launch_model, contents, config)] = label
+
+        raise error
+
+    def generate(self, model: str, contents, config=None, deadline: TurnDeadline | None = None):
+        deadline = deadline or TurnDeadline(60)
+        attempt = 0
+        while True:
+            # Too close to the deadline for the full model: go straight to the light one
+            call_model = model
+            if self.fallback_model and deadline.remaining() <= self.fallback_margin:
+                call_model = self.fallback_model
+
+            try:
+                response, winner = self._race(call_model, contents, config, deadline)
+            except TimeoutError:
+                self._record("timeout")
+                raise
+            except Exception as e:
+                attempt += 1
+                self._wait_to_retry(e, attempt, deadline)
+                continue
+
+            if call_model != model:
+                winner = "fallback"
+            self._record(winner if attempt == 0 else f"{winner}_after_retry")
+            return response
+
+    def _wait_to_retry(self, error: Exception, attempt: int, deadline: TurnDeadline):
+        """Sleep out the backoff before retry `attempt`, or re-raise if out of retries or time."""
+        delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+        if attempt > self.max_retries or delay >= deadline.remaining():
+            self._record("error")
+            raise error
+        print(f"Model call failed ({error}); retrying in {delay:.2f}s")
+        time.sleep(delay)
+
+    def _within(self, deadline: TurnDeadline, func, *args):
+        """Run a blocking call in the pool, giving up once the deadline passes."""
+        future = self._executor.submit(func, *args)
+        try:
+            return future.result(timeout=max(0.0, deadline.remaining()))
+        except FutureTimeout:
+            raise TimeoutError("Model stream exceeded the turn deadline.")
+
+    def stream(self, model: str, contents, config=None, deadline: TurnDeadline | None = None):
+        """
+        Streaming counterpart of generate; yields the response chunks.
+
+        The deadline bounds the wait for every chunk, so a stream that stalls
+        raises TimeoutError instead of hanging. Close to the deadline the
+        fallback model is used, and a stream that fails before its first chunk
+        is retried. Streams aren't hedged: a duplicate would repeat text the
+        caller has already passed on.
+        """
+        deadline = deadline or TurnDeadline(60)
+        attempt = 0
+        while True:
+            call_model = model
+            if self.fallback_model and deadline.remaining() <= self.fallback_margin:
+                call_model = self.fallback_model
+            try:
+                chunks = self._within(deadline, lambda: iter(self.client.models.generate_content_stream(
+                    model=call_model, contents=contents, config=config
+                )))
+                chunk = self._within(deadline, next, chunks, None)
+            except TimeoutError:
+                self._record("timeout")
+                raise
+            except Exception as e:
+                attempt += 1
+                self._wait_to_retry(e, attempt, deadline)
+                continue
+            break
+
+        winner = "fallback" if call_model != model else "primary"
+        try:
+            while chunk is not None:
+                yield chunk
+                chunk = self._within(deadline, next, chunks, None)
+        except TimeoutError:
+            self._record("timeout")
+            raise
+        except Exception:
+            self._record("error")
+            raise
+        self._record(winner if attempt == 0 else f"{winner}_after_retry")
+
+    def stats(self) -> dict:
+        with self._lock:
+            outcomes = dict(self.outcomes)
+            models = list(self.latencies)
+        return {
+            "outcomes": outcomes,
+            "latency": {
+                model: {"p50": self.percentile(model, 0.5), "p95": self.percentile(model, 0.95)}
+                for model in models
+            }
+        }
@@ -0,0 +1,115 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytz
+from intent_router import find_date_range, to_utc_string
+
+SCHEDULING_HINT = re.compile(r"\b(?:schedule|reschedule|meet|meeting|book|free|available|availability|busy|calendar)\b", re.IGNORECASE)
+
+# Widen the guessed range so the model's own choice of bounds (often UTC
+# midnight to midnight) still falls inside it
+PREFETCH_PADDING = timedelta(hours=12)
+
+def parse_utc(value: str) -> datetime:
+    """Parse backend/model timestamps; naive ones are UTC like the backend's free slots."""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt.astimezone(pytz.utc) if dt.tzinfo else pytz.utc.localize(dt)
+
+def clip_freebusy(data: dict, start: datetime, end: datetime) -> dict:
+    """Cut a freebusy payload for a wider range down to [start, end], keeping the backend's formats."""
+    busy = []
+    for slot in data.get("busy", []):
+        slot_start, slot_end = max(parse_utc(slot["start"]), start), min(parse_utc(slot["end"]), end)
+        if slot_start < slot_end:
+            busy.append({"start": to_utc_string(slot_start), "end": to_utc_string(slot_end)})
+
+    free = []
+    for slot in data.get("free", []):
+        slot_start, slot_end = max(parse_utc(slot["start"]), start), min(parse_utc(slot["end"]), end)
+        if slot_start < slot_end:
+            free.append({
+                "start": slot_start.replace(tzinfo=None).isoformat(),
+                "end": slot_end.replace(tzinfo=None).isoformat()
+            })
+    return {"busy": busy, "free": free}
+
+
+class Prefetch:
+    def __init__(self, start: datetime, end: datetime, future):
+        self.start = start
+        self.end = end
+        self.future = future
+
+    def covers(self, start: datetime, end: datetime) -> bool:
+        return self.start <= start and end <= self.end
+
+
+class AvailabilityPrefetcher:
+    """
+    Starts a freebusy fetch for the dates a scheduling request mentions,
+    in parallel with the first model call. If the model then asks for a
+    range inside the prefetched one, the tool is answered from it.
+    """
+
+    def __init__(self, fetch, max_workers: int = 4, timeout: float = 15):
+        # fetch(start_range, end_range) -> freebusy dict or None
+        self.fetch = fetch
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        # The prefetch for the turn in progress in each session
+        self._current = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.cancelled = 0
+
+    def maybe_start(self, user_input: str, now: datetime, session_id: str = "default") -> bool:
+        """Start a prefetch if the input looks like scheduling and mentions a day."""
+        self.cancel(session_id)
+        if not SCHEDULING_HINT.search(user_input):
+            return False
+        date_range = find_date_range(user_input, now)
+        if not date_range:
+            return False
+
+        start = (date_range[0] - PREFETCH_PADDING).astimezone(pytz.utc)
+        end = (date_range[1] + PREFETCH_PADDING).astimezone(pytz.utc)
+        future = self._executor.submit(self.fetch, to_utc_string(start), to_utc_string(end))
+        with self._lock:
+            self._current[session_id] = Prefetch(start, end, future)
+            self.started += 1
+        return True
+
+    def lookup(self, start_range: str, end_range: str, session_id: str = "default") -> dict | None:
+        """Return prefetched availability for the range, or None if it isn't covered."""
+        prefetch = self._current.get(session_id)
+        if prefetch is None:
+            return None
+        try:
+            start, end = parse_utc(start_range), parse_utc(end_range)
+        except ValueError:
+            return None
+        if not prefetch.covers(start, end):
+            return None
+
+        try:
+            data = prefetch.future.result(timeout=self.timeout)
+        except Exception as e:
+            print(f"Availability prefetch failed: {e}")
+            return None
+        if data is None:
+            return None
+        with self._lock:
+            self.used += 1
+        return clip_freebusy(data, start, end)
+
+    def cancel(self, session_id: str = "default"):
+        """Drop the session's current prefetch; a fetch that hasn't started yet never runs."""
+        with self._lock:
+            prefetch = self._current.pop(session_id, None)
+            if prefetch is not None and prefetch.future.cancel():
+                self.cancelled += 1
+
+    def stats(self) -> dict:
+        return {"started": self.started, "used": self.used, "cancelled": self.cancelled}
@@ -0,0 +1,89 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants share a key."""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of agent replies to read-only requests.
+
+    Each entry records the version of every data domain ("calendar",
+    "mail") it was built from. Bumping a domain's version, which happens
+    whenever a tool writes to it, makes those entries stale. Changes made
+    outside the agent are picked up through observe() where the source
+    exposes a version, and otherwise by the TTL.
+    """
+
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.versions = {}
+        self._observed = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(intent: str, **params) -> tuple:
+        return (intent,) + tuple(sorted((name, str(value)) for name, value in params.items()))
+
+    def bump(self, domain: str):
+        """Record a write to a domain, invalidating every entry that depends on it."""
+        with self._lock:
+            self.versions[domain] = self.versions.get(domain, 0) + 1
+
+    def observe(self, domain: str, external_version):
+        """Bump a domain when its version outside the agent (e.g. the mailbox's) has changed."""
+        if external_version is None:
+            return
+        with self._lock:
+            previous = self._observed.get(domain)
+            self._observed[domain] = external_version
+        if previous is not None and previous != external_version:
+            self.bump(domain)
+
+    def get(self, key: tuple) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, stamp, stored_at = entry
+                fresh = time.monotonic() - stored_at < self.ttl_seconds
+                current = all(self.versions.get(domain, 0) == version for domain, version in stamp)
+                if fresh and current:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, domains, response: str):
+        with self._lock:
+            stamp = tuple((domain, self.versions.get(domain, 0)) for domain in sorted(domains))
+            self._entries[key] = (response, stamp, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
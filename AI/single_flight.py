@@ -0,0 +1,55 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces identical requests. The first caller for a key starts the
+    work; callers with the same key that arrive while it runs, or within
+    `window` seconds of it succeeding, await the same result instead of
+    starting their own. A failed run is forgotten at once, so a retry
+    runs again.
+    """
+
+    def __init__(self, window: float = 1.5):
+        self.window = window
+        self._flights = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, func, window: float | None = None):
+        """
+        func is a zero-argument coroutine function, called only by the first caller.
+        `window` overrides the post-completion window for this run; 0 coalesces
+        only while the original is still running.
+        """
+        task, _ = self.start(key, func, window)
+        # Shield so one caller going away doesn't cancel the work the others await
+        return await asyncio.shield(task)
+
+    def start(self, key, func, window: float | None = None) -> tuple[asyncio.Future, bool]:
+        """
+        Like run, without awaiting: returns the run's task and whether it was
+        joined rather than started. Await the task through asyncio.shield.
+        """
+        task = self._flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task, True
+        task = asyncio.ensure_future(func())
+        self._flights[key] = task
+        self.started += 1
+        hold = self.window if window is None else window
+        task.add_done_callback(lambda _: self._expire(key, task, hold))
+        return task, False
+
+    def _expire(self, key, task, hold: float):
+        def expire():
+            if self._flights.get(key) is task:
+                del self._flights[key]
+        if task.cancelled() or task.exception() is not None or hold <= 0:
+            expire()
+        else:
+            asyncio.get_running_loop().call_later(hold, expire)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "started": self.started, "coalesced": self.coalesced}
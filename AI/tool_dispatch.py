@@ -0,0 +1,179 @@
+import asyncio
+import concurrent.futures
+import os
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "http" talks to the backend over the network (split deployments).
+# "inprocess" calls the backend service functions directly; it needs the
+# backend package importable and an event loop bound via bind_event_loop().
+TOOL_DISPATCH_MODE = os.getenv("TOOL_DISPATCH_MODE", "http").lower()
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
+# Longest a tool waits on the backend, in either mode
+INPROCESS_TIMEOUT = float(os.getenv("INPROCESS_TIMEOUT", "30"))
+
+# Reused across tool calls so HTTP mode keeps its connections alive
+_session = requests.Session()
+_loop: asyncio.AbstractEventLoop = None
+
+
+class OutcomeUnknown(Exception):
+    """A write timed out after it may already have reached Google, so it may or may not have happened."""
+
+
+def bind_event_loop(loop: asyncio.AbstractEventLoop):
+    """Register the loop that owns the Mongo client so tools can run coroutines on it."""
+    global _loop
+    _loop = loop
+
+
+def _use_inprocess() -> bool:
+    return TOOL_DISPATCH_MODE == "inprocess" and _loop is not None and _loop.is_running()
+
+
+def _run_inprocess(coro):
+    """Run a backend coroutine on the bound loop from a worker thread."""
+    future = asyncio.run_coroutine_threadsafe(coro, _loop)
+    try:
+        return future.result(timeout=INPROCESS_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        # Cancelling stops the coroutine, but not a Google call already running in its thread
+        future.cancel()
+        raise OutcomeUnknown(f"No result from the backend within {INPROCESS_TIMEOUT:.0f}s.")
+
+
+def _http(method: str, path: str, **kwargs) -> dict | None:
+    """Call the backend over HTTP; returns the JSON body, or None on failure or timeout."""
+    try:
+        response = _session.request(method, f"{BACKEND_URL}{path}", timeout=INPROCESS_TIMEOUT, **kwargs)
+    except requests.ReadTimeout as e:
+        # The backend got the request; a write may still go through
+        if method != "GET":
+            raise OutcomeUnknown(str(e))
+        print(f"Backend call to {path} failed: {e}")
+        return None
+    except requests.RequestException as e:
+        print(f"Backend call to {path} failed: {e}")
+        return None
+    return response.json() if response.status_code == 200 else None
+
+
+def fetch_freebusy(google_id: str, start_range: str, end_range: str) -> dict | None:
+    """Return the backend's free/busy payload, or None on failure."""
+    if _use_inprocess():
+        from app.service.calendar_service import get_freebusy_slots
+        try:
+            return _run_inprocess(get_freebusy_slots(google_id, start_range, end_range))
+        except Exception as e:
+            print(f"In-process freebusy failed: {e}")
+            return None
+
+    return _http(
+        "GET", "/api/calendar/freebusy",
+        params={
+            "google_id": google_id,
+            "start_range": start_range,
+            "end_range": end_range
+        }
+    )
+
+
+def create_event(google_id: str, event: dict) -> dict | None:
+    """Create a calendar event; returns the created event or None on failure. Raises OutcomeUnknown on a timeout."""
+    if _use_inprocess():
+        from app.service.calendar_service import create_calendar_event
+        try:
+            return _run_inprocess(create_calendar_event(google_id, **event))
+        except OutcomeUnknown:
+            raise
+        except Exception as e:
+            print(f"In-process event creation failed: {e}")
+            return None
+
+    return _http("POST", "/api/calendar/create", params={"google_id": google_id}, json=event)
+
+
+def book_event(google_id: str, event: dict) -> dict | None:
+    """Book an event if its slot is free; returns the booked/conflict result or None on failure. Raises OutcomeUnknown on a timeout."""
+    if _use_inprocess():
+        from app.service.calendar_service import book_if_free
+        try:
+            return _run_inprocess(book_if_free(google_id, **event))
+        except OutcomeUnknown:
+            raise
+        except Exception as e:
+            print(f"In-process booking failed: {e}")
+            return None
+
+    return _http("POST", "/api/calendar/book", params={"google_id": google_id}, json=event)
+
+
+def send_email(google_id: str, to: str, subject: str, body: str) -> dict | None:
+    """Send an email; returns the send result or None on failure. Raises OutcomeUnknown on a timeout."""
+    if _use_inprocess():
+        from app.service.gmail_service import send_gmail_message
+        try:
+            return _run_inprocess(send_gmail_message(google_id, to, subject, body))
+        except OutcomeUnknown:
+            raise
+        except Exception as e:
+            print(f"In-process send failed: {e}")
+            return None
+
+    payload = {
+        "to": to,
+        "subject": subject,
+        "body": body
+    }
+    return _http("POST", "/api/gmail/send", params={"google_id": google_id}, json=payload)
+
+
+def fetch_unread(google_id: str, max_results: int = 5, mark_as_read: bool = False) -> dict | None:
+    """Return the backend's unread email payload, or None on failure."""
+    if _use_inprocess():
+        from app.service.gmail_service import get_unread_emails
+        try:
+            return _run_inprocess(get_unread_emails(google_id, max_results, mark_as_read))
+        except Exception as e:
+            print(f"In-process unread fetch failed: {e}")
+            return None
+
+    params = {
+        "google_id": google_id,
+        "max_results": max_results,
+        "mark_as_read": mark_as_read
+    }
+    return _http("GET", "/api/gmail/unread", params=params)
+
+
+def fetch_digest(google_id: str) -> dict | None:
+    """Return the user's precomputed agenda/mail digest, or None if there is none."""
+    if _use_inprocess():
+        from app.service.digest_service import get_user_digest
+        try:
+            return _run_inprocess(get_user_digest(google_id))
+        except Exception as e:
+            print(f"In-process digest fetch failed: {e}")
+            return None
+
+    return _http("GET", "/api/digest", params={"google_id": google_id})
+
+
+def search_mail(google_id: str, query: str, top_k: int = 5) -> dict | None:
+    """Return ranked hits from the user's mail search index, or None on failure."""
+    if _use_inprocess():
+        from app.service.mail_index import search_mail as search_mail_index
+        try:
+            return _run_inprocess(search_mail_index(google_id, query, top_k))
+        except Exception as e:
+            print(f"In-process mail search failed: {e}")
+            return None
+
+    params = {
+        "google_id": google_id,
+        "q": query,
+        "top_k": top_k
+    }
+    return _http("GET", "/api/gmail/search", params=params)
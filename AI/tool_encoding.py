@@ -0,0 +1,142 @@
+import os
+from datetime import datetime
+from email.utils import parseaddr, parsedate_to_datetime
+import pytz
+
+# Per-tool prompt encoding, e.g. "get_current_availability=verbose,retrieve_email=compact".
+# Tools not listed use DEFAULT_ENCODING.
+DEFAULT_ENCODING = os.getenv("TOOL_OUTPUT_DEFAULT_ENCODING", "compact")
+MAX_SLOTS = int(os.getenv("TOOL_OUTPUT_MAX_SLOTS", "12"))
+MAX_EMAILS = int(os.getenv("TOOL_OUTPUT_MAX_EMAILS", "5"))
+SNIPPET_CHARS = int(os.getenv("TOOL_OUTPUT_SNIPPET_CHARS", "90"))
+
+def parse_encoding_setting(setting: str) -> dict:
+    encodings = {}
+    for item in setting.split(","):
+        if "=" in item:
+            tool, encoding = item.split("=", 1)
+            encodings[tool.strip()] = encoding.strip().lower()
+    return encodings
+
+TOOL_ENCODINGS = parse_encoding_setting(os.getenv("TOOL_OUTPUT_ENCODING", ""))
+
+def encoding_for(tool_name: str) -> str:
+    return TOOL_ENCODINGS.get(tool_name, DEFAULT_ENCODING)
+
+
+# --- Verbose encodings ---
+
+def summarize_calendar(data, timezone="US/Eastern"):
+    def fmt(dt_str):
+        dt = datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
+        local_dt = dt.astimezone(pytz.timezone(timezone))
+        return local_dt.strftime("%a, %b %d, %Y %I:%M %p")
+
+    summary = []
+
+    if "free" in data and data["free"]:
+        summary.append("Free Times:")
+        for slot in data["free"]:
+            summary.append(f"  - {fmt(slot['start'])} → {fmt(slot['end'])}")
+
+    if "busy" in data and data["busy"]:
+        summary.append("Busy Times:")
+        for slot in data["busy"]:
+            summary.append(f"  - {fmt(slot['start'])} → {fmt(slot['end'])}")
+
+    return "\n".join(summary)
+
+def format_emails(data):
+    emails = data.get('emails', [])
+    result = []
+
+    for i, email in enumerate(emails, start=1):
+        email_str = (
+            f"Email {i}\n"
+            f"From: {email.get('from')}, Date: {email.get('date')}\n"
+            f"Subject: {email.get('subject')}\n"
+            f"Snippet: {email.get('snippet')}\n"
+        )
+        result.append(email_str)
+
+    return "\n".join(result)
+
+
+# --- Compact encodings ---
+
+def merge_slots(slots: list, timezone: str) -> list:
+    """Convert slots to local datetimes and merge ones that touch or overlap."""
+    tz = pytz.timezone(timezone)
+    parsed = sorted(
+        (
+            datetime.fromisoformat(slot["start"].replace("Z", "+00:00")),
+            datetime.fromisoformat(slot["end"].replace("Z", "+00:00"))
+        )
+        for slot in slots
+    )
+
+    merged = []
+    for start, end in parsed:
+        # The backend returns free slots without an offset; they are UTC like the busy ones
+        start = (start if start.tzinfo else pytz.utc.localize(start)).astimezone(tz)
+        end = (end if end.tzinfo else pytz.utc.localize(end)).astimezone(tz)
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def fmt_clock(dt: datetime) -> str:
+    # 9:00 -> "9", 9:30 -> "9:30", in 24h so am/pm never needs spelling out
+    return f"{dt.hour}" if dt.minute == 0 else f"{dt.hour}:{dt.minute:02d}"
+
+def encode_slots(label: str, slots: list, max_items: int) -> str:
+    """One line per label, with each date written once: 'Free: Mon 10/20 9-11:30,13-17; Tue 10/21 9-17'."""
+    days = []
+    for start, end in slots[:max_items]:
+        day = start.strftime("%a %m/%d")
+        # A slot ending on a later day carries its end date
+        end_text = fmt_clock(end) if end.date() == start.date() else end.strftime("%a %m/%d ") + fmt_clock(end)
+        span = f"{fmt_clock(start)}-{end_text}"
+        if days and days[-1][0] == day:
+            days[-1][1].append(span)
+        else:
+            days.append((day, [span]))
+
+    line = f"{label}: " + "; ".join(f"{day} {','.join(spans)}" for day, spans in days)
+    if len(slots) > max_items:
+        line += f" (+{len(slots) - max_items} more)"
+    return line
+
+def encode_calendar_compact(data: dict, timezone: str = "US/Eastern", max_items: int = MAX_SLOTS) -> str:
+    lines = []
+    for key, label in (("free", "Free"), ("busy", "Busy")):
+        if data.get(key):
+            lines.append(encode_slots(label, merge_slots(data[key], timezone), max_items))
+    return "\n".join(lines) if lines else "No free or busy times in range."
+
+
+def clip_snippet(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+def short_date(date_header: str) -> str:
+    try:
+        return parsedate_to_datetime(date_header).strftime("%m/%d %H:%M")
+    except (TypeError, ValueError):
+        return date_header
+
+def encode_emails_compact(data: dict, max_items: int = MAX_EMAILS, snippet_chars: int = SNIPPET_CHARS) -> str:
+    """One line per email: 'n. Sender (10/19 09:30) | Subject | snippet…'."""
+    emails = data.get("emails", [])
+    if not emails:
+        return "No unread emails."
+
+    lines = []
+    for i, email in enumerate(emails[:max_items], start=1):
+        name, address = parseaddr(email.get("from") or "")
+        sender = name or address or "Unknown"
+        lines.append(f"{i}. {sender} ({short_date(email.get('date') or '')}) | {email.get('subject')} | {clip_snippet(email.get('snippet') or '', snippet_chars)}")
+    if len(emails) > max_items:
+        lines.append(f"(+{len(emails) - max_items} more)")
+    return "\n".join(lines)
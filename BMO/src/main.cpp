@@ -156,6 +156,8 @@ void recordAndStreamAudio() {
 
   http.begin(AI_SERVER_URL);
   http.addHeader("Content-Type", "application/octet-stream");
+  // Lets the server keep a separate conversation for this device
+  http.addHeader("X-Device-Id", WiFi.macAddress());
   int httpResponseCode = http.sendRequest("POST", (uint8_t*)i2s_read_buff, 0); 
 
   size_t bytes_read = 0;
@@ -4,7 +4,6 @@ from datetime import datetime
 from app.service.google_service import authenticate_user
 from app.database import get_users_collection, get_auth_tokens_collection
 from app.models.user import UserCreate
-from googleapiclient.discovery import build
 
 router = APIRouter(prefix="/google", tags=["Auth"])
 
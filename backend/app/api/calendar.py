@@ -1,7 +1,6 @@
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse
-from datetime import datetime, timedelta
-from app.service.google_service import get_calendar_service
+from app.service.calendar_service import get_freebusy_slots, create_calendar_event, book_if_free
 from pydantic import BaseModel
 
 class EventRequest(BaseModel):
@@ -22,48 +21,11 @@ async def get_freebusy(
 ):
     """Get free/busy calendar information"""
     try:
-        service = await get_calendar_service(google_id)
-        
-        # Use provided ranges or calculate dynamically
-        if start_range and end_range:
-            now = start_range
-            end_time = end_range
-        else:
-            # Default: next 24 hours
-            now = datetime.utcnow().isoformat() + 'Z'
-            end_time = (datetime.utcnow() + timedelta(days=1)).isoformat() + 'Z'
-
-        body = {
-            "timeMin": now,
-            "timeMax": end_time,
-            "items": [{"id": "primary"}]
-        }
-
-        freebusy_result = service.freebusy().query(body=body).execute()
-        busy_times = freebusy_result['calendars']['primary']['busy']
-
-        # Calculate free slots
-        last_end = datetime.fromisoformat(now[:-1])
-        free_slots = []
-        for period in busy_times:
-            start = datetime.fromisoformat(period['start'][:-1])
-            if start > last_end:
-                free_slots.append({"start": last_end.isoformat(), "end": start.isoformat()})
-            last_end = datetime.fromisoformat(period['end'][:-1])
-
-        end_dt = datetime.fromisoformat(end_time[:-1])
-        if last_end < end_dt:
-            free_slots.append({"start": last_end.isoformat(), "end": end_dt.isoformat()})
-
-        response = {
-            "busy": busy_times,
-            "free": free_slots
-        }
-
+        response = await get_freebusy_slots(google_id, start_range, end_range)
         return JSONResponse(content=response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
 @router.post("/create")
 async def create_event(
     event: EventRequest,
@@ -71,28 +33,38 @@ async def create_event(
 ):
     """Create an event in Google Calendar."""
     try:
-        service = await get_calendar_service(google_id)
-
-        event_body = {
-            "summary": event.summary,
-            "description": event.description,
-            "start": {
-                "dateTime": event.start_time,
-                "timeZone": event.timezone
-            },
-            "end": {
-                "dateTime": event.end_time,
-                "timeZone": event.timezone
-            }
-        }
-
-        created_event = (
-            service.events()
-            .insert(calendarId="primary", body=event_body)
-            .execute()
+        created_event = await create_calendar_event(
+            google_id,
+            summary=event.summary,
+            description=event.description,
+            start_time=event.start_time,
+            end_time=event.end_time,
+            timezone=event.timezone
         )
 
         return JSONResponse(content=created_event)
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/book")
+async def book_event(
+    event: EventRequest,
+    google_id: str = Query(..., description="Google user ID"),
+    alternatives: int = Query(3, description="Number of alternative slots to suggest on a conflict")
+):
+    """Create an event only if the slot is free; otherwise suggest the nearest free slots."""
+    try:
+        result = await book_if_free(
+            google_id,
+            summary=event.summary,
+            description=event.description,
+            start_time=event.start_time,
+            end_time=event.end_time,
+            timezone=event.timezone,
+            alternatives=alternatives
+        )
+        return JSONResponse(content=result)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
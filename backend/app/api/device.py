@@ -1,86 +1,460 @@
 from fastapi import APIRouter, HTTPException, Request, Response
-from app.service.transcribe_service import transcribe_short_audio_sync
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from app.service.transcribe_service import create_recognizer, stt_executor, SttBusyError, LONG_AUDIO_SECONDS
+from app.service.audio_decode import negotiate_format, decode_stream, SUPPORTED_CONTENT_TYPES
+from app.service.tts_service import synthesize_stream, split_sentences, resolve_format, audio_cache, prerendered, MEDIA_TYPES, TTS_VOICE, TTS_FALLBACK_REPLY
+from app.service.http_clients import get_agent_client, STREAM_TIMEOUT
+from app.service.admission import pipeline_admission, OverloadedError, Ticket
+from app.service.device_sessions import device_sessions, SupersededError, DEVICE_ID_HEADER
 from pydantic import BaseModel
-import numpy as np
+from typing import NamedTuple
+from urllib.parse import quote
+import json
+import uuid
 import httpx  # 👈 New library import
 
 # --- External API Configuration ---
-EXTERNAL_API_URL = "http://0.0.0.0:8001/get-response"
+# Paths on the agent; the shared client carries the base URL (AGENT_URL)
+EXTERNAL_API_URL = "/get-response"
+EXTERNAL_STREAM_URL = "/get-response/stream"
 # ----------------------------------
 
 router = APIRouter(prefix="/audio", tags=["Audio"])
 
-def stereo_to_mono(audio_bytes: bytes) -> bytes:
+# Compressed passthrough uploads (FLAC, Opus) can't be timed without decoding. Past
+# this size they may hold more than LONG_AUDIO_SECONDS (at up to 128 kbps), so they
+# are decoded and segmented instead of streamed.
+PASSTHROUGH_MAX_BITRATE = 128000
+PASSTHROUGH_LONG_BYTES = int(LONG_AUDIO_SECONDS * PASSTHROUGH_MAX_BITRATE / 8)
+
+class Transcription(NamedTuple):
+    text: str
+    audio_seconds: float
+    trimmed_seconds: float
+
+
+async def transcribe_upload(request: Request) -> Transcription:
     """
-    Converts 16-bit PCM stereo to mono.
-    Assumes little-endian signed 16-bit samples.
+    Feed the chunked upload to a streaming recognizer as it arrives, so
+    recognition overlaps the upload and the transcript is ready right after it ends.
+    The recognizer only starts once speech is detected; a recording with no
+    speech never reaches STT and comes back with an empty transcript.
+
+    Raw PCM goes through the preprocessing pipeline. Compressed uploads the
+    recognizer understands (FLAC, Ogg/WebM Opus) are passed straight through;
+    other formats are decoded by ffmpeg as they stream in.
     """
-    samples = np.frombuffer(audio_bytes, dtype=np.int16)
-    if len(samples) % 2 != 0:
-        samples = samples[:-1]
-    left = samples[0::2]
-    right = samples[1::2]
-    # Average the samples to create mono
-    mono = ((left.astype(np.int32) + right.astype(np.int32)) // 2).astype(np.int16)
-    return mono.tobytes()
+    # Turn the request away before reading any audio if STT is backed up; the
+    # slot is held until the transcript is back
+    stt_executor.admit()
+    try:
+        return await _transcribe_admitted(request)
+    finally:
+        stt_executor.release()
 
 
-@router.post("/transcribe")
-async def transcribe_audio_stream(request: Request):
-    audio_data = await request.body()
-    
-    if len(audio_data) == 0:
-        raise HTTPException(status_code=400, detail="No audio data received.")
-        
-    print(f"Received {len(audio_data)} bytes of audio.")
-    
+async def _transcribe_admitted(request: Request) -> Transcription:
+    # The pipeline pulls in numpy, so it is loaded by the first upload rather than at startup
+    from app.service.audio_pipeline import AudioPreprocessor, DEVICE_AUDIO_CHANNELS, DEVICE_SAMPLE_RATE, STT_SAMPLE_RATE, FRAME_BYTES
+
+    audio_format = negotiate_format(request.headers.get("content-type"))
+    if audio_format is None:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported audio format. Send one of: {', '.join(SUPPORTED_CONTENT_TYPES)}"
+        )
+
+    # Audio longer than LONG_AUDIO_SECONDS is segmented and transcribed in parallel
+    # instead of as one stream. Chunked uploads don't say how long they are, so
+    # the switch happens once the audio reaching STT passes that length;
+    # ?long_audio=true (or a raw PCM Content-Length over it) segments from the start.
+    input_rate = audio_format.sample_rate or DEVICE_SAMPLE_RATE
+    layout = audio_format.channels or DEVICE_AUDIO_CHANNELS
+    # An "auto" layout is only known after detection; the widest frame keeps a mono
+    # upload from being segmented early (the mid-stream switch still catches it)
+    frame_bytes = FRAME_BYTES.get(layout, max(FRAME_BYTES.values()))
+    declared_seconds = int(request.headers.get("content-length") or 0) / (frame_bytes * input_rate)
+    long_audio = request.query_params.get("long_audio") == "true" or (
+        audio_format.kind == "pcm" and declared_seconds > LONG_AUDIO_SECONDS
+    )
+    long_audio_bytes = int(LONG_AUDIO_SECONDS * STT_SAMPLE_RATE) * 2
+
+    received = 0
+
+    async def upload_chunks():
+        nonlocal received
+        async for chunk in request.stream():
+            received += len(chunk)
+            yield chunk
+
+    upload = upload_chunks()
+    # Segmenting needs PCM, so long compressed uploads are decoded rather than passed through
+    if audio_format.kind == "passthrough" and not long_audio:
+        preprocessor = None
+        source = upload
+        recognizer_args = {"sample_rate_hertz": audio_format.sample_rate, "encoding": audio_format.encoding}
+    elif audio_format.kind == "pcm":
+        preprocessor = AudioPreprocessor(layout=layout, input_rate=input_rate)
+        source = upload
+        recognizer_args = {"sample_rate_hertz": STT_SAMPLE_RATE}
+    else:
+        preprocessor = AudioPreprocessor(layout="mono", input_rate=STT_SAMPLE_RATE)
+        source = decode_stream(upload, audio_format, STT_SAMPLE_RATE)
+        recognizer_args = {"sample_rate_hertz": STT_SAMPLE_RATE}
+
+    recognizer = None
+    # PCM fed to a streaming recognizer so far, kept so a recording that turns
+    # out to be long can be handed to segmentation from its start
+    fed = bytearray()
+    raw = bytearray()
+
+    async def stream(audio):
+        nonlocal recognizer
+        if recognizer is None:
+            recognizer = create_recognizer(long_audio=long_audio, **recognizer_args)
+            await recognizer.start()
+        recognizer.feed(audio)
+
+    async def feed(audio):
+        nonlocal recognizer, long_audio, fed
+        if not len(audio):
+            return
+        if long_audio:
+            await stream(audio)
+            return
+        fed += audio
+        if len(fed) <= long_audio_bytes:
+            await stream(audio)
+            return
+        print(f"Audio passed {LONG_AUDIO_SECONDS:.0f}s; switching to segmented transcription.")
+        if recognizer:
+            recognizer.abort()
+        recognizer, long_audio = None, True
+        await stream(bytes(fed))
+        fed = bytearray()
+
+    async def replay(head: bytes):
+        yield head
+        async for chunk in upload:
+            yield chunk
+
     try:
-        audio_data = stereo_to_mono(audio_data)
-        print(f"Converted to mono: {len(audio_data)} bytes. Ready for STT.")
+        decode_from = None
+        async for chunk in source:
+            if preprocessor is not None:
+                # Downmix, resample, trim silence and normalize this chunk while the rest is still uploading
+                await feed(preprocessor.process(chunk))
+                continue
+            if not chunk:
+                continue
+            raw += chunk
+            if len(raw) > PASSTHROUGH_LONG_BYTES:
+                decode_from = bytes(raw)
+                break
+            await stream(chunk)
+
+        if decode_from is not None:
+            # A compressed upload can't be timed without decoding it. Past the most that
+            # LONG_AUDIO_SECONDS could take, decode it from the start and segment it.
+            print(f"Passthrough upload passed {len(decode_from)} bytes; decoding it for segmented transcription.")
+            if recognizer:
+                recognizer.abort()
+            recognizer, long_audio = None, True
+            preprocessor = AudioPreprocessor(layout="mono", input_rate=STT_SAMPLE_RATE)
+            recognizer_args = {"sample_rate_hertz": STT_SAMPLE_RATE}
+            async for chunk in decode_stream(replay(decode_from), audio_format, STT_SAMPLE_RATE):
+                await feed(preprocessor.process(chunk))
+
+        if preprocessor:
+            await feed(preprocessor.flush())
+    except HTTPException:
+        if recognizer:
+            recognizer.abort()
+        raise
     except Exception as e:
-        print(f"Failed to convert audio to mono: {e}")
-        # The ESP32 often sends stereo even if configured for mono, so this step is vital.
+        if recognizer:
+            recognizer.abort()
+        print(f"Failed to convert audio: {e}")
         raise HTTPException(status_code=500, detail="Audio conversion failed.")
+    except BaseException:
+        if recognizer:
+            recognizer.abort()
+        raise
+
+    if received == 0:
+        raise HTTPException(status_code=400, detail="No audio data received.")
+
+    if preprocessor is None:
+        print(f"Received {received} bytes of {audio_format.encoding}; passed through to STT.")
+        return Transcription(await recognizer.finish(), 0.0, 0.0)
+
+    audio_seconds = preprocessor.bytes_in / (FRAME_BYTES[preprocessor.layout] * preprocessor.input_rate)
+    print(f"Received {received} bytes ({audio_seconds:.2f}s, {audio_format.kind}, {preprocessor.layout}); trimmed {preprocessor.trimmed_seconds:.2f}s of silence.")
+
+    if recognizer is None or not preprocessor.speech_detected:
+        if recognizer:
+            recognizer.abort()
+        print("No speech detected; skipping STT.")
+        return Transcription("", audio_seconds, preprocessor.trimmed_seconds)
+
+    return Transcription(await recognizer.finish(), audio_seconds, preprocessor.trimmed_seconds)
+
+
+@router.get("/formats")
+async def supported_formats():
+    """Content-Types /transcribe accepts, for clients choosing an upload encoding."""
+    return {
+        "content_types": SUPPORTED_CONTENT_TYPES,
+        "passthrough": [content_type for content_type in SUPPORTED_CONTENT_TYPES
+                        if negotiate_format(content_type).kind == "passthrough"]
+    }
+
+
+def wants_audio_reply(request: Request) -> bool:
+    return request.query_params.get("reply") == "audio"
+
+def audio_reply(request: Request, sentences, headers: dict, status_code: int = 200,
+                background: BackgroundTask = None) -> StreamingResponse:
+    """
+    Stream the reply as audio, sentence by sentence, so playback can start
+    before the whole reply is synthesized. ?format=pcm|mp3 and ?voice= pick
+    the output; the format falls back to what the synthesizer produces.
+    """
+    audio_format = resolve_format(request.query_params.get("format"))
+    voice = request.query_params.get("voice", TTS_VOICE)
+    return StreamingResponse(synthesize_stream(sentences, voice, audio_format), media_type=MEDIA_TYPES[audio_format],
+                             headers=headers, status_code=status_code, background=background)
 
-    
+BUSY_REPLY = "I'm a little busy right now. Please try again in a moment."
+# Rendered at startup, so they play even while TTS is failing
+FIXED_AUDIO_REPLIES = [BUSY_REPLY, TTS_FALLBACK_REPLY]
 
-    # 2️⃣ Transcribe the audio
+def busy_response(request: Request, error: Exception) -> Response:
+    """Fast 503 when STT or the pipeline is full, so the device can retry instead of waiting."""
+    print(f"Turning request away: {error}")
+    headers = {"Retry-After": str(getattr(error, "retry_after", 1))}
+    # Spoken only from the pre-rendered clip; without it the device gets the text
+    if wants_audio_reply(request) and prerendered(BUSY_REPLY, resolve_format(request.query_params.get("format"))):
+        return audio_reply(request, [BUSY_REPLY], headers, status_code=503)
+    return Response(content=BUSY_REPLY, media_type="text/plain", headers=headers, status_code=503)
+
+def superseded_response(error: SupersededError) -> Response:
+    """The device already sent a newer utterance and is no longer waiting for this reply."""
+    print(f"Dropping request: {error}")
+    return Response(content="Superseded by a newer request.", media_type="text/plain", status_code=409)
+
+def device_id_for(request: Request) -> str:
+    """
+    The device's identity header. Clients that don't send one get a fresh id
+    per request: many of them can share an address (proxies, NAT), so they
+    never supersede each other or share a conversation.
+    """
+    return request.headers.get(DEVICE_ID_HEADER) or f"anon:{uuid.uuid4().hex}"
+
+async def start_turn(request: Request):
+    """
+    Register the utterance for its device, cancelling the device's previous
+    one, then wait for a pipeline slot. Returns (turn, ticket), or a
+    Response if the turn was shed or superseded while queued.
+    """
+    turn = device_sessions.begin(device_id_for(request))
     try:
-        transcription = transcribe_short_audio_sync(
-            audio_content=audio_data,
-            sample_rate_hertz=16000
-        )
+        ticket = await turn.run(pipeline_admission.acquire())
+    except OverloadedError as e:
+        device_sessions.end(turn)
+        return busy_response(request, e)
+    except SupersededError as e:
+        device_sessions.end(turn)
+        return superseded_response(e)
+    except BaseException:
+        device_sessions.end(turn)
+        raise
+    return turn, ticket
+
+def finish_turn(turn, ticket: Ticket):
+    """Free the turn's pipeline slot; safe to call more than once."""
+    if turn.finished:
+        return
+    turn.finished = True
+    pipeline_admission.release(ticket)
+    device_sessions.end(turn)
+
+async def agent_reply(transcription: str, session_id: str) -> str:
+    # Shared pooled client, so the connection to the agent is reused across requests
+    external_response = await get_agent_client().post(
+        EXTERNAL_API_URL,
+        # Send the transcription as a JSON body; the session keeps each device's conversation apart
+        json={"input": transcription, "session_id": session_id}
+    )
+    external_response.raise_for_status() # Raise exception for 4xx/5xx errors
+
+    # The external API's response (e.g., {"response": "Okay, turning on the light."})
+    # is assumed to be JSON, containing the final spoken text.
+    response_data = external_response.json()
+    return response_data.get("response", "External service provided no response.")
+
+
+@router.post("/transcribe")
+async def transcribe_audio_stream(request: Request):
+    started = await start_turn(request)
+    if isinstance(started, Response):
+        return started
+    turn, ticket = started
+
+    # 1️⃣ + 2️⃣ Receive and transcribe the audio as it streams in
+    trimmed_seconds = 0.0
+    try:
+        result = await turn.run(transcribe_upload(request))
+        transcription, trimmed_seconds = result.text, result.trimmed_seconds
         print(f"Transcription result: {transcription}")
         
         # 3️⃣ Pass transcription to the external API (New Step)
         if transcription:
             print(f"Transcription: {transcription}. Sending to external API...")
-            
-            # Use httpx for asynchronous request to the external service
-            async with httpx.AsyncClient() as client:
-                external_response = await client.post(
-                    EXTERNAL_API_URL,
-                    # Send the transcription as a JSON body
-                    json={"input": transcription} 
-                )
-                external_response.raise_for_status() # Raise exception for 4xx/5xx errors
-
-            # The external API's response (e.g., {"response": "Okay, turning on the light."})
-            # is assumed to be JSON, containing the final spoken text.
-            response_data = external_response.json()
-            response_text = response_data.get("response", "External service provided no response.")
+            response_text = await turn.run(agent_reply(transcription, turn.session_id))
         else:
             response_text = "I did not understand that."
 
+    except HTTPException:
+        raise
+    except SupersededError as e:
+        return superseded_response(e)
+    except SttBusyError as e:
+        return busy_response(request, e)
     except httpx.HTTPStatusError as e:
         print(f"External API failed with status {e.response.status_code}")
         response_text = f"External server error: {e.response.status_code}"
     except Exception as e:
         print(f"Transcription or processing failed: {e}")
         response_text = "Sorry, I had an error processing the audio."
+    finally:
+        finish_turn(turn, ticket)
+
+    # 4️⃣ Return the final response to the ESP32, as text or as ready-to-play audio
+    headers = {"X-Trimmed-Seconds": f"{trimmed_seconds:.2f}"}
+    if wants_audio_reply(request):
+        headers["X-Reply-Text"] = quote(response_text)
+        return audio_reply(request, split_sentences(response_text), headers)
+    return Response(content=response_text, media_type="text/plain", headers=headers)
+
+
+@router.post("/transcribe/stream")
+async def transcribe_audio_streaming_reply(request: Request):
+    """
+    Same as /transcribe, but streams the reply back as chunked text,
+    one sentence per line (or as audio with ?reply=audio), so the device
+    can start speaking right away. The pipeline slot is held until the
+    reply has finished streaming.
+    """
+    started = await start_turn(request)
+    if isinstance(started, Response):
+        return started
+    turn, ticket = started
+
+    streaming = False
+    try:
+        try:
+            result = await turn.run(transcribe_upload(request))
+            transcription = result.text
+            print(f"Transcription result: {transcription}")
+        except HTTPException:
+            raise
+        except SupersededError as e:
+            return superseded_response(e)
+        except SttBusyError as e:
+            return busy_response(request, e)
+        except Exception as e:
+            print(f"Transcription failed: {e}")
+            transcription, result = None, Transcription("", 0.0, 0.0)
+            error_reply = "Sorry, I had an error processing the audio."
+        else:
+            error_reply = "I did not understand that."
+
+        headers = {"X-Trimmed-Seconds": f"{result.trimmed_seconds:.2f}"}
+        if not transcription:
+            if wants_audio_reply(request):
+                return audio_reply(request, [error_reply], headers)
+            return Response(content=error_reply, media_type="text/plain", headers=headers)
+
+        async def agent_sentences():
+            try:
+                async with get_agent_client().stream("POST", EXTERNAL_STREAM_URL,
+                                                     json={"input": transcription, "session_id": turn.session_id},
+                                                     timeout=STREAM_TIMEOUT) as external_response:
+                    external_response.raise_for_status()
+                    # SSE frames: "data: {...}" lines, with "event:" lines marking done/error
+                    event = "message"
+                    async for line in external_response.aiter_lines():
+                        if turn.superseded:
+                            print(f"Device {turn.device_id} started a newer utterance; dropping the rest of this reply.")
+                            return
+                        if line.startswith("event:"):
+                            event = line[len("event:"):].strip()
+                        elif line.startswith("data:") and event == "message":
+                            text = json.loads(line[len("data:"):]).get("text", "")
+                            if text:
+                                yield text
+                        elif line.startswith("data:") and event == "error":
+                            detail = json.loads(line[len("data:"):]).get("detail")
+                            print(f"Agent failed mid-reply: {detail}")
+                            yield "Sorry, I had an error processing the audio."
+                            return
+                        elif not line:
+                            event = "message"
+            except httpx.HTTPStatusError as e:
+                print(f"External API failed with status {e.response.status_code}")
+                yield f"External server error: {e.response.status_code}"
+            except Exception as e:
+                print(f"Streaming reply failed: {e}")
+                yield "Sorry, I had an error processing the audio."
+            finally:
+                finish_turn(turn, ticket)
+
+        # From here the reply generator owns the turn and finishes it. The background
+        # task covers a client that disconnects before the generator ever starts.
+        streaming = True
+        finish = BackgroundTask(finish_turn, turn, ticket)
+        if wants_audio_reply(request):
+            return audio_reply(request, agent_sentences(), headers, background=finish)
+
+        async def sentence_lines():
+            async for sentence in agent_sentences():
+                yield sentence + "\n"
+
+        return StreamingResponse(sentence_lines(), media_type="text/plain", headers=headers, background=finish)
+    finally:
+        if not streaming:
+            finish_turn(turn, ticket)
+
+
+class SpeakRequest(BaseModel):
+    text: str
+    voice: str = TTS_VOICE
+    format: str = "mp3"
+
+@router.post("/speak")
+async def speak(data: SpeakRequest):
+    """Synthesize text for the device; repeated sentences come from the audio cache."""
+    audio_format = resolve_format(data.format)
+    return StreamingResponse(
+        synthesize_stream(split_sentences(data.text), data.voice, audio_format),
+        media_type=MEDIA_TYPES[audio_format]
+    )
+
+@router.get("/stt/metrics")
+async def stt_metrics():
+    """STT pool queue depth, outcomes and latency."""
+    return stt_executor.stats()
+
+@router.get("/pipeline/metrics")
+async def pipeline_metrics():
+    """Admission (active, queued, shed, latency against the SLO) and per-device turns."""
+    return {"admission": pipeline_admission.stats(), "devices": device_sessions.stats()}
 
-    # 4️⃣ Return the final response text to the ESP32
-    return Response(content=response_text, media_type="text/plain")
+@router.get("/tts/cache")
+async def tts_cache_stats():
+    return audio_cache.stats()
 
 # Define the request body model
 class InputText(BaseModel):
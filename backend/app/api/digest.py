@@ -0,0 +1,23 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from app.service.digest_service import get_user_digest, refresh_user_digest
+
+router = APIRouter(prefix="/digest", tags=["Digest"])
+
+@router.get("")
+async def get_digest(google_id: str = Query(..., description="Google user ID")):
+    """Get the precomputed agenda and unread-mail digest for a user."""
+    digest = await get_user_digest(google_id)
+    if digest is None:
+        raise HTTPException(status_code=404, detail="No digest computed for this user yet.")
+    return JSONResponse(content=jsonable_encoder(digest))
+
+@router.post("/refresh")
+async def refresh_digest(google_id: str = Query(..., description="Google user ID")):
+    """Recompute a user's digest now."""
+    try:
+        await refresh_user_digest(google_id)
+        return JSONResponse(content={"status": "success"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,9 +1,9 @@
-import base64
-from email.mime.text import MIMEText
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from app.service.google_service import get_gmail_service
+from app.service.gmail_service import send_gmail_message, get_unread_emails
+from app.service.mail_index import search_mail, backfill_mail_index
 from datetime import datetime
 
 
@@ -61,23 +61,8 @@ async def send_email(
 ):
     """Send an email"""
     try:
-        service = await get_gmail_service(google_id)
-        
-        message = MIMEText(email.body)
-        message['to'] = email.to
-        message['subject'] = email.subject
-        
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-        
-        send_message = service.users().messages().send(
-            userId='me',
-            body={'raw': raw_message}
-        ).execute()
-        
-        return JSONResponse(content={
-            "status": "success",
-            "message_id": send_message.get('id')
-        })
+        result = await send_gmail_message(google_id, email.to, email.subject, email.body)
+        return JSONResponse(content=result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -88,48 +73,38 @@ async def get_recent_unread_emails(
     mark_as_read: bool = Query(False, description="Mark unread emails as read after fetching")
 ):
     try:
-        service = await get_gmail_service(google_id)
-        max_results = min(max_results, 30)
-
-        response = service.users().messages().list(
-            userId='me',
-            q='is:unread label:inbox',
-            maxResults=max_results
-        ).execute()
+        result = await get_unread_emails(google_id, max_results, mark_as_read)
+        return JSONResponse(content=result)
 
-        messages = response.get('messages', [])
-        if not messages:
-            return JSONResponse(content={"emails": [], "count": 0, "message": "No unread emails found."})
-
-        email_list = []
-        for msg in messages:
-            message = service.users().messages().get(
-                userId='me',
-                id=msg['id'],
-                format='metadata',
-                metadataHeaders=['From', 'Subject', 'Date']
-            ).execute()
-
-            headers = {h['name']: h['value'] for h in message['payload']['headers']}
-            email_list.append({
-                'id': msg['id'],
-                'subject': headers.get('Subject', 'No Subject'),
-                'from': headers.get('From', 'Unknown'),
-                'date': headers.get('Date', ''),
-                'snippet': message.get('snippet', '')
-            })
-
-            if mark_as_read:
-                service.users().messages().modify(
-                    userId='me',
-                    id=msg['id'],
-                    body={'removeLabelIds': ['UNREAD']}
-                ).execute()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch unread emails: {str(e)}")
 
-        return JSONResponse(content={"emails": email_list, "count": len(email_list)})
+@router.get("/search")
+async def search_emails(
+    google_id: str = Query(..., description="Google user ID"),
+    q: str = Query(..., description="Search text; supports from: and subject: filters"),
+    top_k: int = Query(5, description="Maximum number of hits to return"),
+    from_filter: str = Query(None, description="Only messages whose sender contains this text"),
+    subject_filter: str = Query(None, description="Only messages whose subject contains this text")
+):
+    """Ranked full-text search over the user's mirrored mail."""
+    try:
+        result = await search_mail(google_id, q, min(top_k, 20), from_filter, subject_filter)
+        return JSONResponse(content=result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search emails: {str(e)}")
 
+@router.post("/index/backfill")
+async def backfill_index(
+    google_id: str = Query(..., description="Google user ID"),
+    max_messages: int = Query(200, description="Maximum number of recent messages to mirror")
+):
+    """Mirror recent mail into the search index."""
+    try:
+        result = await backfill_mail_index(google_id, max_messages)
+        return JSONResponse(content=result)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch unread emails: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/watch/setup")
 async def setup_watch(
@@ -5,7 +5,9 @@ import json
 import base64
 from app.service.google_service import get_gmail_service, update_watch_history_id
 from app.database import get_auth_tokens_collection, get_users_collection
-import requests
+from app.service.digest_service import refresh_mail_digest
+from app.service.mail_index import index_message
+from app.service.http_clients import get_agent_client
 
 router = APIRouter(prefix="/gmail", tags=["Gmail Webhook"])
 
@@ -99,6 +101,12 @@ async def process_email_changes(google_id: str):
         # Update historyId
         if history.get('historyId'):
             await update_watch_history_id(google_id, history['historyId'])
+
+        # Keep the precomputed unread digest in step with the inbox
+        try:
+            await refresh_mail_digest(google_id)
+        except Exception as digest_error:
+            print(f"Error refreshing mail digest: {str(digest_error)}")
     
     except Exception as e:
         print(f"Error processing email changes: {str(e)}")
@@ -125,10 +133,17 @@ async def process_new_email(google_id: str, message_id: str, service):
         body_text = extract_email_body(message['payload'])
         
         print(f"New email received: From: {from_email}, Subject: {subject}, Thread: {thread_id}")
+
+        # Mirror into the search index before the agent sees it
+        try:
+            date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
+            await index_message(google_id, message_id, thread_id, from_email, subject, body_text, snippet,
+                                date, int(message.get('internalDate', 0)))
+        except Exception as index_error:
+            print(f"Error indexing email: {str(index_error)}")
         
         # Call AI API to process the email
         try:
-            ai_url = "http://localhost:8001/get-response"
             ai_prompt = f"""You received a new email:
 
 From: {from_email}
@@ -142,7 +157,7 @@ Please analyze this email and take appropriate action. Use google_id: {google_id
                 "input": ai_prompt
             }
             
-            ai_response = requests.post(ai_url, json=ai_data, timeout=30)
+            ai_response = await get_agent_client().post("/get-response", json=ai_data)
             
             if ai_response.status_code == 200:
                 ai_result = ai_response.json()
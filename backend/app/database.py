@@ -2,6 +2,7 @@ import os
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
+from app.migrations import apply_migrations, audit_query_plans, QUERY_PLAN_AUDIT
 
 load_dotenv()
 
@@ -13,8 +14,6 @@ load_dotenv(ENV_PATH)
 
 # MongoDB connection
 MONGODB_URI = os.getenv('MONGODB_URI')
-if not MONGODB_URI:
-    raise ValueError("MONGODB_URI not found in .env file. Please set it in backend/.env")
 
 DATABASE_NAME = os.getenv('DATABASE_NAME', 'meeting_schedule_assistant')
 
@@ -22,9 +21,15 @@ DATABASE_NAME = os.getenv('DATABASE_NAME', 'meeting_schedule_assistant')
 _client: AsyncIOMotorClient = None
 _database = None
 
-async def connect_to_mongo():
-    """Create database connection."""
+async def connect_to_mongo(apply_schema: bool = True):
+    """
+    Create database connection. Only the backend applies the schema; other
+    processes sharing the database (the agent) pass apply_schema=False.
+    """
     global _client, _database
+    # Checked here rather than at import, so modules can be imported without a database configured
+    if not MONGODB_URI:
+        raise ValueError("MONGODB_URI not found in .env file. Please set it in backend/.env")
     try:
         # For MongoDB Atlas, the connection string should already include TLS parameters
         # Only add connection timeout options, don't override TLS settings from URI
@@ -37,8 +42,6 @@ async def connect_to_mongo():
         # Test the connection with a ping
         await _client.admin.command('ping')
         _database = _client[DATABASE_NAME]
-        await create_indexes()
-        return _database
     except Exception as e:
         error_msg = str(e)
         if "SSL" in error_msg or "TLS" in error_msg:
@@ -51,6 +54,10 @@ async def connect_to_mongo():
                 f"4. Your MongoDB credentials are correct"
             )
         raise ConnectionError(f"Failed to connect to MongoDB: {error_msg}. Please check your MONGODB_URI and network connection.")
+    # Outside the try so migration and query plan errors aren't reported as connection failures
+    if apply_schema:
+        await create_indexes()
+    return _database
 
 async def close_mongo_connection():
     """Close database connection."""
@@ -59,22 +66,13 @@ async def close_mongo_connection():
         _client.close()
 
 async def create_indexes():
-    """Create database indexes on startup."""
+    """Bring the schema and indexes up to date (see app/migrations.py)."""
     db = get_database()
-    
-    # Users collection indexes
-    users_collection = db['users']
-    await users_collection.create_index('google_id', unique=True)
-    await users_collection.create_index('pending_requests.message_id')  # Index for pending requests
-
-    # Auth tokens collection indexes
-    auth_tokens_collection = db['auth_tokens']
-    await auth_tokens_collection.create_index('user_id')
-    
-    # Negotiation states collection indexes (commented out for now)
-    # negotiation_states_collection = db['negotiation_states']
-    # await negotiation_states_collection.create_index('user_id')
-    # await negotiation_states_collection.create_index('thread_id', unique=True)
+    version = await apply_migrations(db)
+    print(f"Database schema at version {version}.")
+    if QUERY_PLAN_AUDIT:
+        # Fails startup if a hot query would scan its collection
+        await audit_query_plans(db)
 
 def get_database():
     """Get database instance."""
@@ -90,6 +88,14 @@ def get_auth_tokens_collection():
     """Get auth_tokens collection."""
     return get_database()['auth_tokens']
 
+def get_digests_collection():
+    """Get digests collection."""
+    return get_database()['digests']
+
+def get_mail_messages_collection():
+    """Get mail_messages collection."""
+    return get_database()['mail_messages']
+
 # def get_negotiation_states_collection():
 #     """Get negotiation_states collection."""
 #     return get_database()['negotiation_states']
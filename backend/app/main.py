@@ -5,9 +5,14 @@ from app.api.auth import router as auth_router
 from app.api.calendar import router as calendar_router
 from app.api.gmail import router as gmail_router
 from app.database import connect_to_mongo, close_mongo_connection
-from app.api.device import router as device_router
+from app.api.device import router as device_router, FIXED_AUDIO_REPLIES
 from app.api.gmail_webhook import router as gmail_webhook_router
+from app.api.digest import router as digest_router
+from app.service.digest_service import digest_refresh_loop, DIGEST_REFRESH_INTERVAL
+from app.service.http_clients import start_http_clients, close_http_clients
+from app.service.tts_service import prerender
 
+import asyncio
 from contextlib import asynccontextmanager
 from pydantic import BaseModel
 
@@ -15,7 +20,17 @@ from pydantic import BaseModel
 async def lifespan(app: FastAPI):
     # Startup: Connect to MongoDB
     await connect_to_mongo()
+    # Pooled HTTP clients for calls to the agent, reused by every request
+    await start_http_clients()
+    # Precompute agenda/inbox digests off the interactive path
+    digest_task = asyncio.create_task(digest_refresh_loop()) if DIGEST_REFRESH_INTERVAL > 0 else None
+    # Busy and fallback replies the device can hear even while TTS is failing
+    prerender_task = asyncio.create_task(prerender(FIXED_AUDIO_REPLIES))
     yield
+    prerender_task.cancel()
+    if digest_task:
+        digest_task.cancel()
+    await close_http_clients()
     # Shutdown: Close MongoDB connection
     await close_mongo_connection()
 
@@ -39,6 +54,7 @@ app.include_router(calendar_router, prefix="/api", tags=["Calendar"])
 app.include_router(device_router, prefix="/api", tags=["Device"])
 app.include_router(gmail_router, prefix="/api", tags=["Gmail"])  
 app.include_router(gmail_webhook_router, prefix="/api", tags=["Gmail Webhook"])
+app.include_router(digest_router, prefix="/api", tags=["Digest"])
 
 @app.get("/")
 def root():
@@ -0,0 +1,204 @@
+"""
+Schema migrations and indexes for the Mongo layer.
+
+INDEXES declares every index the app relies on, per collection, and
+apply_migrations() brings a database in line with it: numbered data
+migrations run once (recorded in schema_migrations), then each declared
+index is created if missing or rebuilt if its options changed. Running it
+again is a no-op, so it runs on every startup.
+
+HOT_QUERIES lists the queries on request paths. audit_query_plans()
+explains each one and fails if any is answered by a collection scan; it
+runs after the migrations on every startup unless QUERY_PLAN_AUDIT=false.
+
+    python -m app.migrations            # apply migrations, then audit the hot queries
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+from typing import NamedTuple
+from pymongo.errors import OperationFailure
+
+# Explain the hot queries at startup and refuse to start if one scans its collection.
+# On by default; it costs one explain() per hot query.
+QUERY_PLAN_AUDIT = os.getenv('QUERY_PLAN_AUDIT', 'true').lower() == 'true'
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+INDEX_NOT_FOUND = 27  # Mongo's IndexNotFound error code
+
+
+class IndexSpec(NamedTuple):
+    keys: tuple            # ((field, direction), ...)
+    unique: bool = False
+
+    @property
+    def name(self) -> str:
+        # Mongo's default name, so indexes created before this module are recognized
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+def index(*fields: str, unique: bool = False) -> IndexSpec:
+    return IndexSpec(tuple((field, 1) for field in fields), unique)
+
+
+INDEXES = {
+    "users": [
+        index("google_id", unique=True),
+        index("pending_requests.message_id"),
+        # The Gmail webhook maps a push notification's address to its user
+        index("email"),
+    ],
+    "auth_tokens": [
+        # One token document per user; every read and write looks it up by user_id
+        index("user_id", unique=True),
+    ],
+    "digests": [
+        index("user_id", unique=True),
+    ],
+    "mail_messages": [
+        index("user_id", "message_id", unique=True),
+        # Each search loads what was mirrored since the last one
+        index("user_id", "indexed_at"),
+    ],
+    # Negotiation states are not stored yet:
+    # "negotiation_states": [index("user_id"), index("thread_id", unique=True)],
+}
+
+
+class HotQuery(NamedTuple):
+    name: str
+    collection: str
+    filter: dict
+
+
+HOT_QUERIES = []
+
+def register_hot_query(name: str, collection: str, filter: dict):
+    """Register a query on a request path; the values only need the right shape."""
+    HOT_QUERIES.append(HotQuery(name, collection, filter))
+
+register_hot_query("user by email (gmail webhook)", "users", {"email": "audit@example.com"})
+register_hot_query("user by google_id", "users", {"google_id": "audit"})
+register_hot_query("token by user", "auth_tokens", {"user_id": "audit"})
+register_hot_query("digest by user", "digests", {"user_id": "audit"})
+register_hot_query("mail by user (search index)", "mail_messages", {"user_id": "audit"})
+register_hot_query("mail mirrored since last search", "mail_messages", {"user_id": "audit", "indexed_at": {"$gte": datetime(2000, 1, 1)}})
+register_hot_query("mail message by id", "mail_messages", {"user_id": "audit", "message_id": "audit"})
+
+
+# --- Data migrations ---
+# Append only; each runs once, in order, before the indexes are reconciled.
+
+async def dedupe_auth_tokens(db):
+    """Keep the most recently updated token per user so user_id can become unique."""
+    duplicates = db['auth_tokens'].aggregate([
+        {"$sort": {"updated_at": -1}},
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ])
+    removed = 0
+    async for group in duplicates:
+        result = await db['auth_tokens'].delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += result.deleted_count
+    if removed:
+        print(f"Removed {removed} duplicate auth token(s).")
+
+MIGRATIONS = [
+    (1, "dedupe auth_tokens by user_id", dedupe_auth_tokens),
+]
+
+
+async def run_migrations(db) -> int:
+    """Run the data migrations not yet recorded; returns the schema version."""
+    state = db[MIGRATIONS_COLLECTION]
+    applied = {doc["_id"] async for doc in state.find({}, {"_id": 1})}
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"Applying migration {version}: {description}")
+        await migrate(db)
+        await state.update_one(
+            {"_id": version},
+            {"$set": {"description": description, "applied_at": datetime.utcnow()}},
+            upsert=True
+        )
+    return max((version for version, _, _ in MIGRATIONS), default=0)
+
+
+async def apply_indexes(db):
+    """Create missing indexes and rebuild any whose options no longer match the declaration."""
+    for collection_name, specs in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        for spec in specs:
+            current = existing.get(spec.name)
+            if current is not None:
+                if [tuple(key) for key in current["key"]] == list(spec.keys) and current.get("unique", False) == spec.unique:
+                    continue
+                print(f"Rebuilding index {collection_name}.{spec.name} (unique={spec.unique})")
+                try:
+                    await collection.drop_index(spec.name)
+                except OperationFailure as e:
+                    # Another process already dropped it for the same rebuild
+                    if e.code != INDEX_NOT_FOUND:
+                        raise
+            await collection.create_index(list(spec.keys), name=spec.name, unique=spec.unique)
+
+
+async def apply_migrations(db) -> int:
+    version = await run_migrations(db)
+    await apply_indexes(db)
+    return version
+
+
+# --- Query plan audit ---
+
+class QueryPlanError(Exception):
+    pass
+
+
+def plan_stages(plan) -> list:
+    """Every stage name in an explain() plan tree, including nested input stages."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages += plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            stages += plan_stages(item)
+    return stages
+
+
+async def audit_query_plans(db) -> dict:
+    """Explain each hot query; raises QueryPlanError if any of them scans its collection."""
+    plans = {}
+    for query in HOT_QUERIES:
+        explained = await db[query.collection].find(query.filter).limit(1).explain()
+        plans[query.name] = plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+
+    scans = [name for name, stages in plans.items() if "COLLSCAN" in stages]
+    if scans:
+        raise QueryPlanError(f"Collection scan in hot queries: {', '.join(scans)}")
+    return plans
+
+
+async def main():
+    from app.database import connect_to_mongo, close_mongo_connection, get_database
+
+    try:
+        # connect_to_mongo applies the migrations, and audits the hot queries unless QUERY_PLAN_AUDIT=false
+        await connect_to_mongo()
+        for name, stages in (await audit_query_plans(get_database())).items():
+            print(f"{name:<32} {' <- '.join(stages)}")
+        print(f"All {len(HOT_QUERIES)} hot queries use an index.")
+    except QueryPlanError as e:
+        print(f"FAILED: {e}")
+        sys.exit(1)
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
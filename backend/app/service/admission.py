@@ -0,0 +1,122 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, deque
+from typing import NamedTuple
+
+# Voice turns (STT + agent + reply) allowed to run at once, and the latency
+# each one should stay within, from arrival to the end of its reply
+PIPELINE_CONCURRENCY = int(os.getenv('PIPELINE_CONCURRENCY', '4'))
+PIPELINE_SLO = float(os.getenv('PIPELINE_SLO_SECONDS', '8'))
+# Service time assumed before any turn has finished
+INITIAL_SERVICE_SECONDS = float(os.getenv('PIPELINE_INITIAL_SERVICE_SECONDS', '3'))
+
+
+class OverloadedError(Exception):
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket(NamedTuple):
+    arrived: float   # when the turn asked for a slot
+    started: float   # when it got one
+
+
+class AdmissionController:
+    """
+    Limits concurrent voice turns and keeps them within a latency SLO.
+
+    A turn runs at once if a slot is free. Otherwise it queues, but only if
+    the wait expected from its queue position and the recent service time
+    still leaves room for the turn itself inside the SLO; if not, it is shed
+    right away so the device can retry instead of waiting past its budget.
+    """
+
+    def __init__(self, max_concurrent: int, slo: float, initial_service: float):
+        self.max_concurrent = max_concurrent
+        self.slo = slo
+        self.active = 0
+        self.service_time = initial_service   # moving average of time holding a slot, seconds
+        self.latencies = deque(maxlen=200)
+        self.outcomes = Counter()
+        self._waiters = deque()
+
+    def expected_wait(self, position: int) -> float:
+        """Seconds until the waiter at `position` (1-based) should get a slot."""
+        return math.ceil(position / self.max_concurrent) * self.service_time
+
+    async def acquire(self) -> Ticket:
+        """Wait for a slot; pass the returned ticket to release(). Raises OverloadedError to shed the turn."""
+        arrived = time.monotonic()
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.outcomes["admitted"] += 1
+            return Ticket(arrived, arrived)
+
+        budget = self.slo - self.service_time
+        wait = self.expected_wait(len(self._waiters) + 1)
+        if wait > budget:
+            self.outcomes["shed"] += 1
+            raise OverloadedError(f"Expected wait {wait:.1f}s exceeds the {self.slo:.0f}s SLO",
+                                  retry_after=max(1, math.ceil(wait)))
+
+        slot = asyncio.get_running_loop().create_future()
+        self._waiters.append(slot)
+        try:
+            await asyncio.wait_for(asyncio.shield(slot), max(budget, 0.1))
+        except asyncio.TimeoutError:
+            self._drop_waiter(slot)
+            self.outcomes["shed"] += 1
+            raise OverloadedError("Waited too long for a free slot", retry_after=max(1, math.ceil(self.service_time)))
+        except BaseException:
+            self._drop_waiter(slot)
+            raise
+        self.outcomes["queued"] += 1
+        return Ticket(arrived, time.monotonic())
+
+    def _drop_waiter(self, slot: asyncio.Future):
+        if slot in self._waiters:
+            self._waiters.remove(slot)
+        elif slot.done() and not slot.cancelled():
+            # The slot was handed over just as the waiter gave up; pass it on
+            self.release()
+        slot.cancel()
+
+    def release(self, ticket: Ticket | None = None):
+        """Free the slot, recording the turn's latency when its ticket is given."""
+        if ticket is not None:
+            now = time.monotonic()
+            latency = now - ticket.arrived
+            self.latencies.append(latency)
+            self.service_time = 0.8 * self.service_time + 0.2 * (now - ticket.started)
+            if latency > self.slo:
+                self.outcomes["over_slo"] += 1
+        while self._waiters:
+            slot = self._waiters.popleft()
+            if not slot.done():
+                # The slot passes straight to the next waiter, so active stays the same
+                slot.set_result(None)
+                return
+        self.active -= 1
+
+    def percentile(self, fraction: float) -> float | None:
+        samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "slo_seconds": self.slo,
+            "service_seconds": round(self.service_time, 3),
+            "outcomes": dict(self.outcomes),
+            "latency": {"p50": self.percentile(0.5), "p95": self.percentile(0.95)}
+        }
+
+
+pipeline_admission = AdmissionController(PIPELINE_CONCURRENCY, PIPELINE_SLO, INITIAL_SERVICE_SECONDS)
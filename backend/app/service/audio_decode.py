@@ -0,0 +1,111 @@
+import asyncio
+import os
+import tempfile
+from typing import NamedTuple
+
+FFMPEG_PATH = os.getenv('FFMPEG_PATH', 'ffmpeg')
+DECODE_CHUNK_BYTES = 8192
+
+
+class AudioFormat(NamedTuple):
+    kind: str                  # "pcm", "passthrough" (recognizer decodes it) or "decode" (ffmpeg)
+    encoding: str              # recognizer encoding for pcm/passthrough uploads
+    sample_rate: int | None    # None: take the rate from the stream or the device default
+    channels: str | None = None
+    # MP4/M4A keep their index at the end of the file, so ffmpeg cannot read them from a pipe
+    needs_file: bool = False
+
+
+def _params(content_type: str) -> dict:
+    params = {}
+    for part in content_type.split(";")[1:]:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            params[key.strip().lower()] = value.strip().strip('"').lower()
+    return params
+
+def negotiate_format(content_type: str | None) -> AudioFormat | None:
+    """Map an upload's Content-Type to how it is ingested; None if unsupported."""
+    content_type = (content_type or "application/octet-stream").lower()
+    media_type = content_type.split(";")[0].strip()
+    params = _params(content_type)
+
+    if media_type in ("application/octet-stream", "audio/l16", "audio/pcm"):
+        rate = int(params["rate"]) if "rate" in params else None
+        channels = {"1": "mono", "2": "stereo"}.get(params.get("channels"))
+        return AudioFormat("pcm", "LINEAR16", rate, channels)
+    if media_type in ("audio/flac", "audio/x-flac"):
+        return AudioFormat("passthrough", "FLAC", None)
+    if media_type in ("audio/ogg", "audio/opus") and params.get("codecs", "opus") == "opus":
+        return AudioFormat("passthrough", "OGG_OPUS", 48000)
+    if media_type == "audio/webm" and params.get("codecs", "opus") == "opus":
+        return AudioFormat("passthrough", "WEBM_OPUS", 48000)
+    if media_type in ("audio/mp4", "audio/m4a", "audio/x-m4a", "video/mp4"):
+        return AudioFormat("decode", "LINEAR16", None, needs_file=True)
+    if media_type in ("audio/wav", "audio/x-wav", "audio/wave", "audio/aac", "audio/mpeg", "audio/webm", "audio/ogg"):
+        return AudioFormat("decode", "LINEAR16", None)
+    return None
+
+SUPPORTED_CONTENT_TYPES = [
+    "application/octet-stream", "audio/L16;rate=16000;channels=1",
+    "audio/flac", "audio/ogg;codecs=opus", "audio/webm;codecs=opus",
+    "audio/mp4", "audio/x-m4a", "audio/wav", "audio/aac", "audio/mpeg"
+]
+
+
+async def decode_stream(chunks, audio_format: AudioFormat, sample_rate: int):
+    """
+    Decode a compressed upload with ffmpeg while it is still arriving,
+    yielding mono 16-bit PCM at sample_rate.
+    """
+    spool = None
+    process = None
+    pump_task = stderr_task = None
+    try:
+        if audio_format.needs_file:
+            spool = tempfile.NamedTemporaryFile(suffix=".m4a", delete=False)
+            async for chunk in chunks:
+                # File writes block, so they run off the event loop
+                await asyncio.to_thread(spool.write, chunk)
+            spool.close()
+
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG_PATH, "-hide_banner", "-loglevel", "error",
+            "-i", spool.name if spool else "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1",
+            stdin=asyncio.subprocess.DEVNULL if spool else asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        # Drained while decoding, so ffmpeg can't block on a full stderr pipe
+        stderr_task = asyncio.create_task(process.stderr.read())
+
+        async def pump():
+            try:
+                async for chunk in chunks:
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            finally:
+                process.stdin.close()
+
+        pump_task = asyncio.create_task(pump()) if not spool else None
+        while True:
+            data = await process.stdout.read(DECODE_CHUNK_BYTES)
+            if not data:
+                break
+            yield data
+        if pump_task:
+            await pump_task
+        if await process.wait() != 0:
+            error = (await stderr_task).decode(errors="replace").strip()
+            raise ValueError(f"ffmpeg could not decode the upload: {error}")
+    finally:
+        for task in (pump_task, stderr_task):
+            if task and not task.done():
+                task.cancel()
+        if process and process.returncode is None:
+            process.kill()
+            await process.wait()
+        if spool:
+            spool.close()
+            os.unlink(spool.name)
@@ -0,0 +1,301 @@
+import os
+from collections import deque
+import numpy as np
+
+# Channel layout of device uploads: "auto", "mono", "stereo" (average both),
+# "left" or "right" (keep one channel of an interleaved stream)
+DEVICE_AUDIO_CHANNELS = os.getenv('DEVICE_AUDIO_CHANNELS', 'auto').lower()
+DEVICE_SAMPLE_RATE = int(os.getenv('DEVICE_SAMPLE_RATE', '16000'))
+STT_SAMPLE_RATE = int(os.getenv('STT_SAMPLE_RATE', '16000'))
+# Gain normalization: scale toward this fraction of full scale, never by more than AUDIO_MAX_GAIN
+AUDIO_TARGET_PEAK = float(os.getenv('AUDIO_TARGET_PEAK', '0.7'))
+AUDIO_MAX_GAIN = float(os.getenv('AUDIO_MAX_GAIN', '4'))
+# Per-chunk decay of the running peak the gain is based on
+PEAK_DECAY = 0.95
+
+# Voice activity detection: a 20ms frame is speech if its RMS (int16 scale) reaches
+# VAD_ENERGY_THRESHOLD, or half of it with a zero-crossing rate of at least
+# VAD_ZCR_THRESHOLD (quiet fricatives like "s" and "f"). Silence beyond
+# VAD_PADDING_MS around speech is dropped, and pauses are capped at twice that.
+VAD_ENABLED = os.getenv('VAD_ENABLED', '1') == '1'
+VAD_ENERGY_THRESHOLD = float(os.getenv('VAD_ENERGY_THRESHOLD', '300'))
+VAD_ZCR_THRESHOLD = float(os.getenv('VAD_ZCR_THRESHOLD', '0.25'))
+VAD_FRAME_MS = 20
+VAD_PADDING_MS = int(os.getenv('VAD_PADDING_MS', '200'))
+VAD_MIN_SPEECH_MS = int(os.getenv('VAD_MIN_SPEECH_MS', '60'))
+
+# "auto" mode holds audio back until it has enough non-silent frames to
+# guess the layout, and falls back to mono after MAX_DETECT_SECONDS
+DETECT_BYTES = 8000
+MAX_DETECT_SECONDS = 2.0
+MIN_DETECT_FRAMES = 200
+SILENCE_LEVEL = 64
+FRAME_BYTES = {"mono": 2, "stereo": 4, "left": 4, "right": 4}
+EMPTY = memoryview(b"")
+
+
+def detect_layout(samples: np.ndarray) -> str | None:
+    """
+    Guess how an int16 stream is laid out. The ESP32 I2S driver either
+    sends plain mono or interleaved frames where one channel is silent
+    or an exact copy of the other; anything else is treated as mono.
+    Returns None while there is too little non-silent audio to tell.
+    """
+    pairs = samples[:len(samples) // 2 * 2].reshape(-1, 2)
+    loud = pairs[(np.abs(pairs[:, 0]) > SILENCE_LEVEL) | (np.abs(pairs[:, 1]) > SILENCE_LEVEL)]
+    if len(loud) < MIN_DETECT_FRAMES:
+        return None
+    if not np.any(loud[:, 1]):
+        return "left"
+    if not np.any(loud[:, 0]):
+        return "right"
+    if np.mean(loud[:, 0] == loud[:, 1]) > 0.9:
+        return "stereo"
+    return "mono"
+
+
+def find_segment_cut(samples: np.ndarray, sample_rate: int, search_seconds: float) -> tuple:
+    """
+    Where to end a segment: the middle of the quietest 20ms frame in the last
+    search_seconds of samples, and whether that frame is below the VAD threshold.
+    """
+    frame_size = sample_rate * VAD_FRAME_MS // 1000
+    start = max(0, len(samples) - int(search_seconds * sample_rate))
+    frames = (len(samples) - start) // frame_size
+    if frames == 0:
+        return len(samples), False
+    window = samples[start:start + frames * frame_size].astype(np.float32).reshape(-1, frame_size)
+    rms = np.sqrt(np.mean(window * window, axis=1))
+    quietest = int(np.argmin(rms))
+    return start + quietest * frame_size + frame_size // 2, bool(rms[quietest] < VAD_ENERGY_THRESHOLD)
+
+
+class SilenceTrimmer:
+    """
+    Energy and zero-crossing VAD over a float sample stream. push() returns
+    the samples to keep so far; silent frames are held back until it is
+    known whether speech follows them.
+    """
+
+    def __init__(self, sample_rate: int, energy_threshold: float = VAD_ENERGY_THRESHOLD,
+                 zcr_threshold: float = VAD_ZCR_THRESHOLD, padding_ms: int = VAD_PADDING_MS,
+                 min_speech_ms: int = VAD_MIN_SPEECH_MS):
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        self.zcr_threshold = zcr_threshold
+        self.frame_size = sample_rate * VAD_FRAME_MS // 1000
+        self.padding_frames = max(1, padding_ms // VAD_FRAME_MS)
+        self.min_speech_frames = max(1, min_speech_ms // VAD_FRAME_MS)
+        self.speech_seen = False
+        self.trimmed_samples = 0
+
+        self._partial = np.empty(0, dtype=np.float32)
+        self._held = deque()   # silent (or not yet confirmed) frames
+        self._speech_run = 0
+
+    @property
+    def trimmed_seconds(self) -> float:
+        return self.trimmed_samples / self.sample_rate
+
+    def _is_speech(self, frames: np.ndarray) -> np.ndarray:
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return (rms >= self.energy_threshold) | ((rms >= self.energy_threshold / 2) & (zcr >= self.zcr_threshold))
+
+    def _drop(self, index: int):
+        self.trimmed_samples += len(self._held[index])
+        del self._held[index]
+
+    def push(self, samples: np.ndarray) -> np.ndarray:
+        if len(self._partial):
+            samples = np.concatenate((self._partial, samples))
+        whole = len(samples) - len(samples) % self.frame_size
+        self._partial = samples[whole:].copy()
+        if not whole:
+            return self._partial[:0]
+        frames = samples[:whole].reshape(-1, self.frame_size)
+
+        kept = []
+        for frame, speech in zip(frames, self._is_speech(frames)):
+            self._held.append(frame.copy())
+            if speech:
+                self._speech_run += 1
+                if self.speech_seen or self._speech_run >= self.min_speech_frames:
+                    self.speech_seen = True
+                    kept.extend(self._held)
+                    self._held.clear()
+                continue
+
+            self._speech_run = 0
+            if not self.speech_seen:
+                # Leading silence: keep only the padding right before speech starts
+                while len(self._held) > self.padding_frames:
+                    self._drop(0)
+            elif len(self._held) > 2 * self.padding_frames:
+                # A pause: keep padding after the last speech and before the next, drop the middle
+                self._drop(self.padding_frames)
+
+        return np.concatenate(kept) if kept else self._partial[:0]
+
+    def finish(self) -> np.ndarray:
+        """Trailing audio to keep once the stream has ended."""
+        self.trimmed_samples += len(self._partial)
+        self._partial = self._partial[:0]
+        if not self.speech_seen:
+            while self._held:
+                self._drop(0)
+            return self._partial
+        while len(self._held) > self.padding_frames:
+            self._drop(len(self._held) - 1)
+        tail = np.concatenate(self._held) if self._held else self._partial
+        self._held.clear()
+        return tail
+
+
+class AudioPreprocessor:
+    """
+    Streaming downmix -> resample -> silence trim -> gain stage for 16-bit PCM uploads.
+
+    process() takes each chunk as it arrives (bytes or memoryview), reads
+    it in place and writes into buffers that are reused between chunks.
+    The returned memoryview points into those buffers, so it is only
+    valid until the next call; copy it if it must be kept.
+    """
+
+    def __init__(self, layout: str = DEVICE_AUDIO_CHANNELS, input_rate: int = DEVICE_SAMPLE_RATE,
+                 output_rate: int = STT_SAMPLE_RATE, target_peak: float = AUDIO_TARGET_PEAK,
+                 max_gain: float = AUDIO_MAX_GAIN, trim_silence: bool = VAD_ENABLED):
+        self.layout = None if layout == "auto" else layout
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.target_peak = target_peak * 32767
+        self.max_gain = max_gain
+        self.peak = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.trimmer = SilenceTrimmer(output_rate) if trim_silence else None
+
+        self._pending = bytearray()  # audio held back until the layout is known
+        self._carry = bytearray()    # partial frame left over from the previous chunk
+        self._work = np.empty(0, dtype=np.float32)
+        self._out = np.empty(0, dtype=np.int16)
+        # Resampler state: last input sample and the next output position relative to it
+        self._previous = 0.0
+        self._position = 1.0
+
+    def _buffers(self, frames: int, output_frames: int):
+        # Grow only; steady-state chunks reuse the same arrays
+        if len(self._work) < frames + 1:
+            self._work = np.empty(frames + 1, dtype=np.float32)
+        if len(self._out) < output_frames:
+            self._out = np.empty(output_frames, dtype=np.int16)
+
+    def _downmix(self, data: memoryview) -> np.ndarray:
+        """Mono float samples for every whole frame in data; slot 0 holds the resampler's previous sample."""
+        frame_bytes = FRAME_BYTES[self.layout]
+        head = None
+        if self._carry:
+            need = frame_bytes - len(self._carry)
+            self._carry += data[:need]
+            data = data[need:]
+            if len(self._carry) == frame_bytes:
+                head = np.frombuffer(self._carry, dtype=np.int16)
+
+        whole = len(data) - len(data) % frame_bytes
+        body = np.frombuffer(data[:whole], dtype=np.int16).reshape(-1, frame_bytes // 2)
+        frames = len(body) + (head is not None)
+        self._buffers(frames, int(frames * self.output_rate / self.input_rate) + 2)
+
+        work = self._work[:frames + 1]
+        work[0] = self._previous
+        target = work[2:] if head is not None else work[1:]
+        if head is not None:
+            work[1] = self._mix_frame(head)
+
+        if self.layout in ("mono", "left"):
+            target[:] = body[:, 0]
+        elif self.layout == "right":
+            target[:] = body[:, 1]
+        else:
+            np.add(body[:, 0], body[:, 1], out=target, dtype=np.float32)
+            target *= 0.5
+
+        if head is not None:
+            self._carry = bytearray()
+        self._carry += data[whole:]
+        return work
+
+    def _mix_frame(self, frame: np.ndarray) -> float:
+        if self.layout == "stereo":
+            return (float(frame[0]) + float(frame[1])) / 2
+        return float(frame[1] if self.layout == "right" else frame[0])
+
+    def _resample(self, work: np.ndarray) -> np.ndarray:
+        """Linear interpolation, carrying the fractional position across chunks."""
+        self._previous = float(work[-1])
+        if self.input_rate == self.output_rate:
+            return work[1:]
+
+        step = self.input_rate / self.output_rate
+        positions = np.arange(self._position, len(work) - 1, step)
+        self._position = (positions[-1] + step if len(positions) else self._position) - (len(work) - 1)
+        return np.interp(positions, np.arange(len(work)), work).astype(np.float32, copy=False)
+
+    def _trim(self, samples: np.ndarray) -> np.ndarray:
+        return self.trimmer.push(samples) if self.trimmer else samples
+
+    @property
+    def speech_detected(self) -> bool:
+        return self.trimmer is None or self.trimmer.speech_seen
+
+    @property
+    def trimmed_seconds(self) -> float:
+        return self.trimmer.trimmed_seconds if self.trimmer else 0.0
+
+    def _apply_gain(self, samples: np.ndarray) -> memoryview:
+        if len(samples) > len(self._out):
+            # Held-back frames released at once can exceed one chunk's worth
+            self._out = np.empty(len(samples), dtype=np.int16)
+        if len(samples):
+            chunk_peak = max(float(samples.max()), -float(samples.min()))
+            self.peak = max(chunk_peak, self.peak * PEAK_DECAY)
+        gain = min(self.max_gain, self.target_peak / self.peak) if self.peak > 0 else 1.0
+        if gain != 1.0:
+            samples *= gain
+        np.clip(samples, -32768, 32767, out=samples)
+        out = self._out[:len(samples)]
+        out[:] = samples
+        self.bytes_out += out.nbytes
+        return memoryview(out).cast("B")
+
+    def process(self, chunk) -> memoryview:
+        data = memoryview(chunk).cast("B")
+        self.bytes_in += len(data)
+
+        if self.layout is None:
+            self._pending += data
+            if len(self._pending) < DETECT_BYTES:
+                return EMPTY
+            # Two seconds even if the stream turns out to be stereo
+            return self._process_pending(final=len(self._pending) >= MAX_DETECT_SECONDS * self.input_rate * 4)
+
+        if not len(data):
+            return EMPTY
+        return self._apply_gain(self._trim(self._resample(self._downmix(data))))
+
+    def _process_pending(self, final: bool) -> memoryview:
+        layout = detect_layout(np.frombuffer(self._pending, dtype=np.int16, count=len(self._pending) // 2))
+        if layout is None and not final:
+            return EMPTY
+        self.layout = layout or "mono"
+        pending = self._pending
+        self._pending = bytearray()
+        return self._apply_gain(self._trim(self._resample(self._downmix(memoryview(pending)))))
+
+    def flush(self) -> bytes:
+        """Audio still held back (for layout detection or by the trimmer) at the end of the upload."""
+        tail = bytes(self._process_pending(final=True)) if self.layout is None and self._pending else b""
+        if self.trimmer:
+            tail += bytes(self._apply_gain(self.trimmer.finish()))
+        return tail
@@ -0,0 +1,167 @@
+import asyncio
+from datetime import datetime, timedelta, time
+from zoneinfo import ZoneInfo
+from app.service.google_service import get_calendar_service
+
+# Alternatives offered when a booking conflicts: same-length slots within
+# working hours, on a half-hour grid, searched this many days either side
+WORKDAY_START_HOUR = 8
+WORKDAY_END_HOUR = 18
+ALTERNATIVE_STEP = timedelta(minutes=30)
+ALTERNATIVE_SEARCH_DAYS = 2
+
+# Serializes check-then-insert per user so two bookings in this process can't take the same slot
+_booking_locks = {}
+
+async def get_freebusy_slots(google_id: str, start_range: str = None, end_range: str = None) -> dict:
+    """Return the user's busy periods and the free slots between them."""
+    service = await get_calendar_service(google_id)
+
+    # Use provided ranges or calculate dynamically
+    if start_range and end_range:
+        now = start_range
+        end_time = end_range
+    else:
+        # Default: next 24 hours
+        now = datetime.utcnow().isoformat() + 'Z'
+        end_time = (datetime.utcnow() + timedelta(days=1)).isoformat() + 'Z'
+
+    body = {
+        "timeMin": now,
+        "timeMax": end_time,
+        "items": [{"id": "primary"}]
+    }
+
+    # googleapiclient blocks, so its calls run off the event loop
+    freebusy_result = await asyncio.to_thread(service.freebusy().query(body=body).execute)
+    busy_times = freebusy_result['calendars']['primary']['busy']
+
+    # Calculate free slots
+    last_end = datetime.fromisoformat(now[:-1])
+    free_slots = []
+    for period in busy_times:
+        start = datetime.fromisoformat(period['start'][:-1])
+        if start > last_end:
+            free_slots.append({"start": last_end.isoformat(), "end": start.isoformat()})
+        last_end = datetime.fromisoformat(period['end'][:-1])
+
+    end_dt = datetime.fromisoformat(end_time[:-1])
+    if last_end < end_dt:
+        free_slots.append({"start": last_end.isoformat(), "end": end_dt.isoformat()})
+
+    return {
+        "busy": busy_times,
+        "free": free_slots
+    }
+
+async def create_calendar_event(
+    google_id: str,
+    summary: str,
+    description: str | None,
+    start_time: str,
+    end_time: str,
+    timezone: str = "UTC"
+) -> dict:
+    """Insert an event into the user's primary calendar and return it."""
+    service = await get_calendar_service(google_id)
+
+    event_body = {
+        "summary": summary,
+        "description": description,
+        "start": {
+            "dateTime": start_time,
+            "timeZone": timezone
+        },
+        "end": {
+            "dateTime": end_time,
+            "timeZone": timezone
+        }
+    }
+
+    return await asyncio.to_thread(
+        service.events()
+        .insert(calendarId="primary", body=event_body)
+        .execute
+    )
+
+
+def _parse_event_time(value: str, timezone: str) -> datetime:
+    """Parse an event time; naive values are wall-clock time in the event's timezone."""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=ZoneInfo(timezone))
+
+def _utc_string(dt: datetime) -> str:
+    return dt.astimezone(ZoneInfo("UTC")).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _overlaps(start: datetime, end: datetime, busy: list) -> list:
+    return [(b_start, b_end) for b_start, b_end in busy if b_start < end and start < b_end]
+
+def _nearest_free_slots(start: datetime, end: datetime, busy: list, count: int) -> list:
+    """Same-length free slots in working hours, closest to the requested start first."""
+    tz = start.tzinfo
+    duration = end - start
+    now = datetime.now(tz)
+    candidates = []
+    day = start.date() - timedelta(days=ALTERNATIVE_SEARCH_DAYS)
+    while day <= start.date() + timedelta(days=ALTERNATIVE_SEARCH_DAYS):
+        candidate = datetime.combine(day, time(WORKDAY_START_HOUR), tz)
+        day_end = datetime.combine(day, time(WORKDAY_END_HOUR), tz)
+        while candidate + duration <= day_end:
+            if candidate >= now and not _overlaps(candidate, candidate + duration, busy):
+                candidates.append(candidate)
+            candidate += ALTERNATIVE_STEP
+        day += timedelta(days=1)
+
+    candidates.sort(key=lambda candidate: abs(candidate - start))
+    return [
+        {"start": candidate.replace(tzinfo=None).isoformat(), "end": (candidate + duration).replace(tzinfo=None).isoformat()}
+        for candidate in candidates[:count]
+    ]
+
+async def book_if_free(
+    google_id: str,
+    summary: str,
+    description: str | None,
+    start_time: str,
+    end_time: str,
+    timezone: str = "UTC",
+    alternatives: int = 3
+) -> dict:
+    """
+    Create the event if the requested window is free, in one operation.
+    On a conflict nothing is created and the nearest free same-length
+    slots are returned instead (in the event's timezone, without offset).
+    """
+    start = _parse_event_time(start_time, timezone).astimezone(ZoneInfo(timezone))
+    end = _parse_event_time(end_time, timezone).astimezone(ZoneInfo(timezone))
+    if end <= start:
+        raise ValueError("end_time must be after start_time")
+
+    lock = _booking_locks.setdefault(google_id, asyncio.Lock())
+    async with lock:
+        service = await get_calendar_service(google_id)
+
+        # One freebusy query covers both the conflict check and the alternative search
+        window_start = datetime.combine(start.date() - timedelta(days=ALTERNATIVE_SEARCH_DAYS), time(0), start.tzinfo)
+        window_end = datetime.combine(start.date() + timedelta(days=ALTERNATIVE_SEARCH_DAYS + 1), time(0), start.tzinfo)
+        # Off the event loop: the lock only serializes this user's bookings
+        freebusy_result = await asyncio.to_thread(service.freebusy().query(body={
+            "timeMin": _utc_string(window_start),
+            "timeMax": _utc_string(window_end),
+            "items": [{"id": "primary"}]
+        }).execute)
+        busy = [
+            (_parse_event_time(period['start'], "UTC"), _parse_event_time(period['end'], "UTC"))
+            for period in freebusy_result['calendars']['primary']['busy']
+        ]
+
+        conflicts = _overlaps(start, end, busy)
+        if conflicts:
+            return {
+                "status": "conflict",
+                "conflicts": [{"start": _utc_string(b_start), "end": _utc_string(b_end)} for b_start, b_end in conflicts],
+                "alternatives": _nearest_free_slots(start, end, busy, alternatives)
+            }
+
+        event = await create_calendar_event(google_id, summary, description, start_time, end_time, timezone)
+        return {"status": "booked", "event": event}
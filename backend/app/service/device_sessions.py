@@ -0,0 +1,71 @@
+import asyncio
+from collections import Counter
+
+# Devices identify themselves with this header (the ESP32 sends its MAC address)
+DEVICE_ID_HEADER = "X-Device-Id"
+
+
+class SupersededError(Exception):
+    pass
+
+
+class DeviceTurn:
+    """One utterance from a device, from upload to the end of its reply."""
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.superseded = False
+        self.finished = False
+        self._task = None
+
+    @property
+    def session_id(self) -> str:
+        """Agent session holding this device's conversation."""
+        return f"device:{self.device_id}"
+
+    async def run(self, coro):
+        """Run coro as part of the turn; raises SupersededError if a newer utterance cancels it."""
+        if self.superseded:
+            coro.close()
+            raise SupersededError(f"Device {self.device_id} started a newer utterance")
+        self._task = asyncio.ensure_future(coro)
+        try:
+            return await self._task
+        except asyncio.CancelledError:
+            if self.superseded and self._task.cancelled():
+                raise SupersededError(f"Device {self.device_id} started a newer utterance")
+            raise
+        finally:
+            self._task = None
+
+    def supersede(self):
+        self.superseded = True
+        if self._task is not None:
+            self._task.cancel()
+
+
+class DeviceSessions:
+    """Keeps at most one turn running per device; a new utterance cancels the one in flight."""
+
+    def __init__(self):
+        self._turns = {}
+        self.outcomes = Counter()
+
+    def begin(self, device_id: str) -> DeviceTurn:
+        previous = self._turns.get(device_id)
+        if previous is not None:
+            previous.supersede()
+            self.outcomes["superseded"] += 1
+        turn = self._turns[device_id] = DeviceTurn(device_id)
+        self.outcomes["started"] += 1
+        return turn
+
+    def end(self, turn: DeviceTurn):
+        if self._turns.get(turn.device_id) is turn:
+            del self._turns[turn.device_id]
+
+    def stats(self) -> dict:
+        return {"active_devices": len(self._turns), "outcomes": dict(self.outcomes)}
+
+
+device_sessions = DeviceSessions()
@@ -0,0 +1,95 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from app.database import get_digests_collection
+from app.service.calendar_service import get_freebusy_slots
+from app.service.gmail_service import get_unread_emails
+
+# How often the background job refreshes every user's digest (0 disables it)
+DIGEST_REFRESH_INTERVAL = float(os.getenv('DIGEST_REFRESH_INTERVAL', '600'))
+# Days of agenda to precompute after today
+DIGEST_DAYS = int(os.getenv('DIGEST_DAYS', '2'))
+DIGEST_CONCURRENCY = int(os.getenv('DIGEST_CONCURRENCY', '4'))
+# Only users whose digest was read (i.e. who used the agent) this recently are refreshed
+DIGEST_ACTIVE_SECONDS = float(os.getenv('DIGEST_ACTIVE_SECONDS', '86400'))
+
+async def refresh_agenda_digest(google_id: str):
+    """Precompute free/busy from the start of today (UTC) through DIGEST_DAYS more days."""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_range = today.isoformat() + 'Z'
+    end_range = (today + timedelta(days=DIGEST_DAYS + 1)).isoformat() + 'Z'
+    freebusy = await get_freebusy_slots(google_id, start_range, end_range)
+
+    await get_digests_collection().update_one(
+        {"user_id": google_id},
+        {"$set": {
+            "agenda": dict(freebusy, start_range=start_range, end_range=end_range),
+            "agenda_computed_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+async def refresh_mail_digest(google_id: str):
+    """Precompute the unread inbox summary the agent's retrieve_email tool reads."""
+    unread = await get_unread_emails(google_id, max_results=5, mark_as_read=False)
+
+    await get_digests_collection().update_one(
+        {"user_id": google_id},
+        {"$set": {"mail": unread, "mail_computed_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def refresh_user_digest(google_id: str):
+    await asyncio.gather(refresh_agenda_digest(google_id), refresh_mail_digest(google_id))
+
+async def get_user_digest(google_id: str) -> dict | None:
+    """
+    Return the stored digest with each part's age in seconds. Each read
+    marks the user active, so the background job keeps their digest fresh.
+    """
+    digest = await get_digests_collection().find_one_and_update(
+        {"user_id": google_id},
+        {"$set": {"last_read_at": datetime.utcnow()}},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    digest.pop("last_read_at", None)
+    if not digest.get("agenda") and not digest.get("mail"):
+        return None
+
+    now = datetime.utcnow()
+    for part in ("agenda", "mail"):
+        computed_at = digest.pop(f"{part}_computed_at", None)
+        if computed_at:
+            digest[f"{part}_age_seconds"] = (now - computed_at).total_seconds()
+            # Changes whenever the part is recomputed (the Gmail webhook does so for new mail),
+            # so the agent can tell its cached replies are out of date
+            digest[f"{part}_version"] = computed_at.isoformat()
+    return digest
+
+async def refresh_all_digests():
+    """Refresh the digest of every user who read theirs within DIGEST_ACTIVE_SECONDS."""
+    semaphore = asyncio.Semaphore(DIGEST_CONCURRENCY)
+
+    async def refresh(google_id: str):
+        async with semaphore:
+            try:
+                await refresh_user_digest(google_id)
+            except Exception as e:
+                print(f"Failed to refresh digest for {google_id}: {str(e)}")
+
+    active_since = datetime.utcnow() - timedelta(seconds=DIGEST_ACTIVE_SECONDS)
+    cursor = get_digests_collection().find({"last_read_at": {"$gte": active_since}}, {"user_id": 1})
+    google_ids = [doc['user_id'] async for doc in cursor]
+    await asyncio.gather(*(refresh(google_id) for google_id in google_ids))
+
+async def digest_refresh_loop():
+    """Background job started from the app lifespan."""
+    while True:
+        try:
+            await refresh_all_digests()
+        except Exception as e:
+            print(f"Digest refresh failed: {str(e)}")
+        await asyncio.sleep(DIGEST_REFRESH_INTERVAL)
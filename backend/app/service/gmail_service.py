@@ -0,0 +1,68 @@
+import asyncio
+import base64
+from email.mime.text import MIMEText
+from app.service.google_service import get_gmail_service
+
+async def send_gmail_message(google_id: str, to: str, subject: str, body: str) -> dict:
+    """Send a plain-text email from the user's mailbox."""
+    service = await get_gmail_service(google_id)
+
+    message = MIMEText(body)
+    message['to'] = to
+    message['subject'] = subject
+
+    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+
+    # googleapiclient blocks, so its calls run off the event loop
+    send_message = await asyncio.to_thread(service.users().messages().send(
+        userId='me',
+        body={'raw': raw_message}
+    ).execute)
+
+    return {
+        "status": "success",
+        "message_id": send_message.get('id')
+    }
+
+async def get_unread_emails(google_id: str, max_results: int = 10, mark_as_read: bool = False) -> dict:
+    """Fetch metadata and snippets for the most recent unread inbox emails."""
+    service = await get_gmail_service(google_id)
+    max_results = min(max_results, 30)
+
+    # googleapiclient blocks, so its calls run off the event loop
+    response = await asyncio.to_thread(service.users().messages().list(
+        userId='me',
+        q='is:unread label:inbox',
+        maxResults=max_results
+    ).execute)
+
+    messages = response.get('messages', [])
+    if not messages:
+        return {"emails": [], "count": 0, "message": "No unread emails found."}
+
+    email_list = []
+    for msg in messages:
+        message = await asyncio.to_thread(service.users().messages().get(
+            userId='me',
+            id=msg['id'],
+            format='metadata',
+            metadataHeaders=['From', 'Subject', 'Date']
+        ).execute)
+
+        headers = {h['name']: h['value'] for h in message['payload']['headers']}
+        email_list.append({
+            'id': msg['id'],
+            'subject': headers.get('Subject', 'No Subject'),
+            'from': headers.get('From', 'Unknown'),
+            'date': headers.get('Date', ''),
+            'snippet': message.get('snippet', '')
+        })
+
+        if mark_as_read:
+            await asyncio.to_thread(service.users().messages().modify(
+                userId='me',
+                id=msg['id'],
+                body={'removeLabelIds': ['UNREAD']}
+            ).execute)
+
+    return {"emails": email_list, "count": len(email_list)}
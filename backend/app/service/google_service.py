@@ -1,9 +1,7 @@
+import asyncio
 import os
 from datetime import datetime, timedelta
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
 from app.database import get_auth_tokens_collection
 from app.service.encryption import encrypt_token, decrypt_token
 
@@ -20,6 +18,15 @@ SCOPES = [
     'https://www.googleapis.com/auth/userinfo.profile',  # Add this
 ]
 
+def build(service_name: str, version: str, credentials: Credentials):
+    """googleapiclient takes long to import, so it is loaded when the first service is built."""
+    from googleapiclient.discovery import build as build_service
+    return build_service(service_name, version, credentials=credentials)
+
+def refresh_request():
+    from google.auth.transport.requests import Request
+    return Request()
+
 async def get_credentials_for_user(google_id: str) -> Credentials:
     """Load credentials for a specific user from MongoDB."""
     auth_tokens_collection = get_auth_tokens_collection()
@@ -59,7 +66,7 @@ async def get_credentials_for_user(google_id: str) -> Credentials:
 
 async def refresh_user_token(google_id: str, creds: Credentials):
     """Refresh access token and update in database."""
-    creds.refresh(Request())
+    await asyncio.to_thread(creds.refresh, refresh_request())
     
     auth_tokens_collection = get_auth_tokens_collection()
     encrypted_refresh = encrypt_token(creds.refresh_token)
@@ -98,13 +105,14 @@ async def save_credentials_for_user(google_id: str, creds: Credentials, watch_hi
 
 async def authenticate_user():
     """Authenticate user and return google_id, email, and credentials."""
+    from google_auth_oauthlib.flow import InstalledAppFlow
     flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
     creds = flow.run_local_server(port=0, prompt='consent',   access_type='offline')  
     
     # Validate credentials have a token
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+            await asyncio.to_thread(creds.refresh, refresh_request())
         else:
             raise ValueError("Failed to obtain valid credentials")
     
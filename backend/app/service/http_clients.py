@@ -0,0 +1,64 @@
+import os
+import httpx
+
+# Base URL of the AI agent service (AI/main.py)
+AGENT_URL = os.getenv('AGENT_URL', 'http://localhost:8001').rstrip('/')
+
+# Pool and timeout settings shared by the internal clients
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+# Seconds to wait for a free pooled connection before giving up
+HTTP_POOL_TIMEOUT = float(os.getenv('HTTP_POOL_TIMEOUT', '5'))
+# Seconds the agent may take to answer a non-streaming request
+AGENT_TIMEOUT = float(os.getenv('AGENT_TIMEOUT', '30'))
+# HTTP/2 needs the h2 package (httpx[http2]) and is only negotiated over https
+HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', 'false').lower() == 'true'
+
+# The read timeout is the longest gap between received bytes, not the whole reply, so a
+# stream that sends a sentence at a time stays open while a stalled one is cut off
+STREAM_TIMEOUT = httpx.Timeout(AGENT_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT, read=AGENT_TIMEOUT)
+
+_clients: dict = {}
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("HTTP2_ENABLED is set but h2 is not installed; using HTTP/1.1.")
+        return False
+
+def _create_client(base_url: str, timeout: float) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=_http2_available(),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+    )
+
+async def start_http_clients():
+    """Open the shared clients. Called from the app lifespan."""
+    get_agent_client()
+
+async def close_http_clients():
+    """Close the shared clients and their pooled connections."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+def get_agent_client() -> httpx.AsyncClient:
+    """Pooled client for calls to the agent; created on first use outside the lifespan (scripts, tests)."""
+    client = _clients.get("agent")
+    if client is None or client.is_closed:
+        client = _clients["agent"] = _create_client(AGENT_URL, AGENT_TIMEOUT)
+    return client
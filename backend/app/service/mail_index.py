@@ -0,0 +1,225 @@
+import asyncio
+import math
+import re
+from collections import Counter, defaultdict
+from datetime import datetime
+from app.database import get_mail_messages_collection
+
+# Field weights for scoring: a subject or sender hit counts more than a body hit
+FIELD_WEIGHTS = {"subject": 3.0, "from": 2.0, "body": 1.0}
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Mirrored bodies are clipped; long threads add little beyond their first screens
+MAX_BODY_CHARS = 20000
+
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "for", "from", "has", "have", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "re", "that", "the", "this", "to", "was",
+    "we", "with", "you", "your", "fwd"
+}
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+FILTER_PATTERN = re.compile(r"\b(from|subject):(\"[^\"]+\"|\S+)")
+
+def tokenize(text: str) -> list:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class MailIndex:
+    """In-memory inverted index over one user's mirrored messages."""
+
+    def __init__(self):
+        # field -> term -> {message_id: term frequency}
+        self.postings = {field: defaultdict(dict) for field in FIELD_WEIGHTS}
+        # field -> {message_id: token count}
+        self.lengths = {field: {} for field in FIELD_WEIGHTS}
+        self.messages = {}
+        # Newest indexed_at loaded from the mirror
+        self.synced_at = None
+
+    def add(self, message: dict):
+        message_id = message["message_id"]
+        if message_id in self.messages:
+            self.remove(message_id)
+        self.messages[message_id] = message
+        for field in FIELD_WEIGHTS:
+            tokens = tokenize(message.get(field) or "")
+            self.lengths[field][message_id] = len(tokens)
+            for term, count in Counter(tokens).items():
+                self.postings[field][term][message_id] = count
+
+    def remove(self, message_id: str):
+        message = self.messages.pop(message_id, None)
+        if message is None:
+            return
+        for field in FIELD_WEIGHTS:
+            self.lengths[field].pop(message_id, None)
+            for term in set(tokenize(message.get(field) or "")):
+                self.postings[field][term].pop(message_id, None)
+
+    def _field_scores(self, field: str, terms: list) -> Counter:
+        """BM25 score of every message matching any of the terms in one field."""
+        scores = Counter()
+        lengths = self.lengths[field]
+        if not lengths:
+            return scores
+        average_length = sum(lengths.values()) / len(lengths) or 1
+        for term in terms:
+            term_postings = self.postings[field].get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (len(lengths) - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for message_id, tf in term_postings.items():
+                norm = K1 * (1 - B + B * lengths[message_id] / average_length)
+                scores[message_id] += idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 5, filters: dict | None = None) -> list:
+        """
+        Ranked search across subject, sender and body. `filters` maps a
+        field to text every result must contain in that field; inline
+        `from:alice` and `subject:"budget review"` are parsed out of the query.
+        """
+        filters = dict(filters or {})
+        for field, value in FILTER_PATTERN.findall(query):
+            filters[field] = value.strip('"')
+        terms = tokenize(FILTER_PATTERN.sub(" ", query))
+
+        candidates = None
+        for field, value in filters.items():
+            required = tokenize(value)
+            matching = set(self.messages)
+            for term in required:
+                matching &= set(self.postings[field].get(term, {}))
+            candidates = matching if candidates is None else candidates & matching
+
+        scores = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for message_id, score in self._field_scores(field, terms).items():
+                scores[message_id] += weight * score
+
+        if candidates is not None:
+            # Filter-only queries still return the matches, newest first
+            ranked = sorted(candidates, key=lambda message_id: (scores[message_id], self.messages[message_id].get("internal_date", 0)), reverse=True)
+        else:
+            ranked = [message_id for message_id, _ in scores.most_common()]
+        return [dict(self.messages[message_id], score=round(scores[message_id], 3)) for message_id in ranked[:k]]
+
+
+# google_id -> MailIndex, loaded from the mirror on first use
+_indexes = {}
+
+async def get_user_index(google_id: str) -> MailIndex:
+    """
+    The user's index, brought up to date with the mirror. Another process
+    (the backend webhook, when search runs in the agent) may have mirrored
+    mail since the last search, so anything indexed after the last sync is loaded.
+    """
+    index = _indexes.setdefault(google_id, MailIndex())
+    query = {"user_id": google_id}
+    if index.synced_at is not None:
+        # $gte: a message written in the same instant as the last one loaded is not missed
+        query["indexed_at"] = {"$gte": index.synced_at}
+    async for message in get_mail_messages_collection().find(query, {"_id": 0}):
+        indexed_at = message.pop("indexed_at", None)
+        index.add(message)
+        if indexed_at and (index.synced_at is None or indexed_at > index.synced_at):
+            index.synced_at = indexed_at
+    return index
+
+async def index_message(google_id: str, message_id: str, thread_id: str, from_email: str, subject: str,
+                        body: str, snippet: str, date: str = "", internal_date: int = 0):
+    """Mirror a message and add it to the user's index if that is loaded."""
+    message = {
+        "user_id": google_id,
+        "message_id": message_id,
+        "thread_id": thread_id,
+        "from": from_email,
+        "subject": subject,
+        "body": (body or snippet or "")[:MAX_BODY_CHARS],
+        "snippet": snippet,
+        "date": date,
+        "internal_date": internal_date,
+        "indexed_at": datetime.utcnow()
+    }
+    await get_mail_messages_collection().update_one(
+        {"user_id": google_id, "message_id": message_id},
+        {"$set": message},
+        upsert=True
+    )
+    if google_id in _indexes:
+        message.pop("indexed_at")
+        _indexes[google_id].add(message)
+
+def best_passage(body: str, terms: list, width: int = 160) -> str:
+    """The part of the body around the first query term, for compact hits."""
+    text = " ".join(body.split())
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms if lowered.find(term) >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    passage = text[start:start + width]
+    return ("…" if start else "") + passage + ("…" if start + width < len(text) else "")
+
+async def search_mail(google_id: str, query: str, k: int = 5, from_filter: str = None, subject_filter: str = None) -> dict:
+    filters = {}
+    if from_filter:
+        filters["from"] = from_filter
+    if subject_filter:
+        filters["subject"] = subject_filter
+
+    index = await get_user_index(google_id)
+    terms = tokenize(FILTER_PATTERN.sub(" ", query))
+    hits = [
+        {
+            "id": hit["message_id"],
+            "thread_id": hit.get("thread_id"),
+            "from": hit.get("from"),
+            "subject": hit.get("subject"),
+            "date": hit.get("date"),
+            "snippet": best_passage(hit.get("body") or "", terms),
+            "score": hit["score"]
+        }
+        for hit in index.search(query, k, filters)
+    ]
+    return {"hits": hits, "count": len(hits)}
+
+async def backfill_mail_index(google_id: str, max_messages: int = 200, query: str = "in:inbox") -> dict:
+    """Mirror the most recent messages so search covers mail from before the watch started."""
+    from app.api.gmail_webhook import extract_email_body
+    from app.service.google_service import get_gmail_service
+
+    service = await get_gmail_service(google_id)
+    collection = get_mail_messages_collection()
+    existing = {doc["message_id"] async for doc in collection.find({"user_id": google_id}, {"message_id": 1})}
+
+    # Bounded by messages looked at, not added, so an already mirrored inbox isn't paged through to the end
+    indexed = 0
+    scanned = 0
+    page_token = None
+    while scanned < max_messages:
+        # googleapiclient blocks, so its calls run off the event loop
+        response = await asyncio.to_thread(service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=min(100, max_messages - scanned),
+            pageToken=page_token
+        ).execute)
+        messages = response.get('messages', [])
+        scanned += len(messages)
+        for msg in messages:
+            if msg['id'] in existing:
+                continue
+            message = await asyncio.to_thread(service.users().messages().get(userId='me', id=msg['id'], format='full').execute)
+            headers = {h['name']: h['value'] for h in message['payload'].get('headers', [])}
+            await index_message(
+                google_id, msg['id'], message.get('threadId'),
+                headers.get('From', ''), headers.get('Subject', ''),
+                extract_email_body(message['payload']), message.get('snippet', ''),
+                headers.get('Date', ''), int(message.get('internalDate', 0))
+            )
+            indexed += 1
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+    return {"status": "success", "indexed": indexed, "scanned": scanned}
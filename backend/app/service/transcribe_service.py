@@ -1,8 +1,14 @@
 # backend/app/services/test_transcribe.py (RUN THIS FILE)
 
+import asyncio
 import os
+import queue
+import re
 import sys
-from google.cloud import speech
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Dynamic Path Setup (Copied from transcribe_service.py) ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -11,25 +17,134 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SERVICE_ACCOUNT_FILE_NAME = 'service-key.json' 
 SERVICE_ACCOUNT_PATH = os.path.join(BASE_DIR, SERVICE_ACCOUNT_FILE_NAME)
 
-# 2. CRITICAL: Set the environment variable
-if os.path.exists(SERVICE_ACCOUNT_PATH):
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = SERVICE_ACCOUNT_PATH
-else:
-    print(f"FATAL ERROR: Service Account key not found at {SERVICE_ACCOUNT_PATH}")
-    sys.exit(1) # Stop execution if key is missing
+# "google" streams to Cloud Speech; "local" is an offline stand-in for tests and dev
+STT_BACKEND = os.getenv('STT_BACKEND', 'google').lower()
 
 # --- Client Initialization ---
-try:
-    speech_client = speech.SpeechClient()
-    print("Client initialized successfully.")
-except Exception as e:
-    print(f"FATAL ERROR: Failed to initialize Google SpeechClient: {e}")
-    sys.exit(1) # Stop execution if auth fails
+# google.cloud.speech (and grpc under it) takes a while to import, so the
+# module and the client are only loaded when the first recognition starts.
+# A missing key then fails that request instead of the whole server.
+speech = None
+speech_client = None
+_client_lock = threading.Lock()
+
+def get_speech_client():
+    """Import Cloud Speech and create the shared client on first use."""
+    global speech, speech_client
+    with _client_lock:
+        if speech_client is None:
+            if os.path.exists(SERVICE_ACCOUNT_PATH):
+                os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = SERVICE_ACCOUNT_PATH
+            else:
+                raise RuntimeError(f"Service Account key not found at {SERVICE_ACCOUNT_PATH}")
+            from google.cloud import speech as speech_module
+            speech_client = speech_module.SpeechClient()
+            speech = speech_module
+            print("Client initialized successfully.")
+    return speech_client
+
+# --- STT Worker Pool ---
+# Every blocking recognition call runs here, never on the event loop. Each
+# request holds a slot from admission until its transcript is back; once
+# STT_QUEUE_LIMIT requests are waiting beyond the workers, new ones are turned
+# away at once instead of queueing behind them.
+STT_WORKERS = int(os.getenv('STT_WORKERS', '4'))
+STT_QUEUE_LIMIT = int(os.getenv('STT_QUEUE_LIMIT', '4'))
+# Seconds a transcript may take once all of its audio has been sent
+STT_DEADLINE = float(os.getenv('STT_DEADLINE', '30'))
+
+
+class SttBusyError(Exception):
+    pass
+
+
+class SttExecutor:
+    """Bounded thread pool for STT calls with admission control and latency stats."""
+
+    def __init__(self, workers: int, queue_limit: int, deadline: float):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.deadline = deadline
+        self.in_flight = 0
+        self.admitted = 0
+        self.latencies = deque(maxlen=200)
+        self.outcomes = Counter()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stt")
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.admitted - self.workers)
+
+    @property
+    def busy(self) -> bool:
+        return self.queue_depth >= self.queue_limit
+
+    def admit(self):
+        """
+        Reserve a slot for a new request, or raise SttBusyError if it should be
+        turned away. The slot is held, counting from before any audio is
+        decoded, until release().
+        """
+        if self.busy:
+            self.outcomes["rejected"] += 1
+            raise SttBusyError(f"STT queue is full ({self.queue_depth} waiting)")
+        self.admitted += 1
+
+    def release(self):
+        self.admitted -= 1
+
+    def submit(self, func, *args) -> asyncio.Future:
+        """Run func on the pool. Call admit() first for new requests; work for an admitted request is never refused."""
+        self.in_flight += 1
+        submitted = time.monotonic()
+        future = asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+        def done(finished: asyncio.Future):
+            self.in_flight -= 1
+            if finished.cancelled():
+                self.outcomes["cancelled"] += 1
+            elif finished.exception():
+                self.outcomes["failed"] += 1
+            else:
+                self.outcomes["completed"] += 1
+                self.latencies.append(time.monotonic() - submitted)
+
+        future.add_done_callback(done)
+        return future
+
+    async def wait(self, future: asyncio.Future, deadline: float | None = None):
+        # Shielded so a timeout doesn't mark the call finished while its worker is still busy
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), deadline or self.deadline)
+        except asyncio.TimeoutError:
+            self.outcomes["timed_out"] += 1
+            raise
+
+    def percentile(self, fraction: float) -> float | None:
+        samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "admitted": self.admitted,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queue_limit": self.queue_limit,
+            "outcomes": dict(self.outcomes),
+            "latency": {"p50": self.percentile(0.5), "p95": self.percentile(0.95)}
+        }
+
+
+stt_executor = SttExecutor(STT_WORKERS, STT_QUEUE_LIMIT, STT_DEADLINE)
 
 # --- Transcription Function (Your Logic) ---
 def transcribe_short_audio_sync(audio_content: bytes, sample_rate_hertz: int = 44100) -> str:
     """Performs synchronous transcription on audio content (<= 60 seconds)."""
-    
+    client = get_speech_client()
+
     audio = speech.RecognitionAudio(content=audio_content)
     
     config = speech.RecognitionConfig(
@@ -38,10 +153,196 @@ def transcribe_short_audio_sync(audio_content: bytes, sample_rate_hertz: int = 4
         language_code="en-US",
     )
 
-    response = speech_client.recognize(config=config, audio=audio)
+    response = client.recognize(config=config, audio=audio, timeout=STT_DEADLINE)
     
     return "\n".join([result.alternatives[0].transcript for result in response.results])
 
+# --- Streaming Recognition ---
+# Cloud Speech rejects streaming requests above ~25KB of audio each
+MAX_STREAM_REQUEST_BYTES = 16000
+
+
+class StreamingRecognizer:
+    """
+    Recognizer that takes PCM chunks while the upload is still arriving.
+    start() before the first chunk, feed() each chunk, then finish() for
+    the transcript; abort() if the upload fails part way.
+    """
+
+    def __init__(self, sample_rate_hertz: int | None = 16000, encoding: str = "LINEAR16"):
+        self.sample_rate_hertz = sample_rate_hertz
+        self.encoding = encoding
+        self.bytes_received = 0
+
+    async def start(self):
+        pass
+
+    def feed(self, chunk: bytes):
+        self.bytes_received += len(chunk)
+
+    async def finish(self) -> str:
+        raise NotImplementedError
+
+    def abort(self):
+        pass
+
+
+class GoogleStreamingRecognizer(StreamingRecognizer):
+    """Runs Cloud Speech streaming_recognize in a worker thread fed from a queue."""
+
+    def __init__(self, sample_rate_hertz: int | None = 16000, encoding: str = "LINEAR16"):
+        super().__init__(sample_rate_hertz, encoding)
+        self._chunks = queue.Queue()
+        self._result = None
+
+    def _requests(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            for offset in range(0, len(chunk), MAX_STREAM_REQUEST_BYTES):
+                yield speech.StreamingRecognizeRequest(audio_content=chunk[offset:offset + MAX_STREAM_REQUEST_BYTES])
+
+    def _recognize(self) -> str:
+        client = get_speech_client()
+        config = {"encoding": speech.RecognitionConfig.AudioEncoding[self.encoding], "language_code": "en-US"}
+        if self.sample_rate_hertz:
+            # FLAC carries its own rate in the stream header
+            config["sample_rate_hertz"] = self.sample_rate_hertz
+        streaming_config = speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(**config),
+            interim_results=False,
+        )
+        responses = client.streaming_recognize(config=streaming_config, requests=self._requests())
+        return "\n".join(
+            result.alternatives[0].transcript
+            for response in responses
+            for result in response.results
+            if result.is_final and result.alternatives
+        )
+
+    async def start(self):
+        self._result = stt_executor.submit(self._recognize)
+
+    def feed(self, chunk: bytes):
+        super().feed(chunk)
+        self._chunks.put(bytes(chunk))
+
+    async def finish(self) -> str:
+        self._chunks.put(None)
+        return await stt_executor.wait(self._result)
+
+    def abort(self):
+        # Ends the request stream; the worker returns whatever was recognized so far
+        self._chunks.put(None)
+
+
+class LocalStreamingRecognizer(StreamingRecognizer):
+    """
+    Offline stand-in: consumes the stream the same way and returns
+    LOCAL_STT_TRANSCRIPT (or nothing) once the upload ends.
+    """
+
+    async def finish(self) -> str:
+        return os.getenv('LOCAL_STT_TRANSCRIPT', '') if self.bytes_received else ''
+
+
+# --- Long Audio ---
+# Synchronous recognition takes at most 60s per request, so long uploads are
+# cut into segments below that, at the quietest point of the last
+# SEGMENT_SEARCH_SECONDS. A cut with no pause to use overlaps the next
+# segment by SEGMENT_OVERLAP_SECONDS and the repeated words are dropped.
+LONG_AUDIO_SECONDS = float(os.getenv('LONG_AUDIO_SECONDS', '60'))
+SEGMENT_MAX_SECONDS = float(os.getenv('STT_SEGMENT_MAX_SECONDS', '55'))
+# At most the last third of a segment, so no cut falls before 2/3 of SEGMENT_MAX_SECONDS
+SEGMENT_SEARCH_SECONDS = min(10.0, SEGMENT_MAX_SECONDS / 3)
+SEGMENT_OVERLAP_SECONDS = 1.0
+
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+def _overlap_length(previous: list, following: list, max_words: int = 8) -> int:
+    """Number of leading words of `following` that repeat the end of `previous`."""
+    for n in range(min(max_words, len(previous), len(following)), 0, -1):
+        if [_normalize_word(w) for w in previous[-n:]] == [_normalize_word(w) for w in following[:n]]:
+            return n
+    return 0
+
+def stitch_transcripts(parts: list) -> str:
+    """Join (text, overlaps_previous) segment transcripts in order."""
+    words = []
+    for text, overlaps_previous in parts:
+        segment_words = text.split()
+        if overlaps_previous and words:
+            segment_words = segment_words[_overlap_length(words, segment_words):]
+        words.extend(segment_words)
+    return " ".join(words)
+
+
+class LongAudioRecognizer(StreamingRecognizer):
+    """
+    Recognizer for uploads longer than one synchronous request. Each segment
+    is sent to the STT pool as soon as enough audio has arrived, so
+    transcription time follows the longest segment, not the whole upload.
+    """
+
+    def __init__(self, sample_rate_hertz: int = 16000, transcribe_segment=None):
+        super().__init__(sample_rate_hertz)
+        self._transcribe_segment = transcribe_segment or transcribe_short_audio_sync
+        self._buffer = bytearray()
+        self._segments = []   # (future, overlaps_previous)
+        self._overlap_next = False
+        self._max_bytes = int(SEGMENT_MAX_SECONDS * sample_rate_hertz) * 2
+
+    def _submit(self, audio: bytes):
+        future = stt_executor.submit(self._transcribe_segment, audio, self.sample_rate_hertz)
+        self._segments.append((future, self._overlap_next))
+
+    def feed(self, chunk: bytes):
+        import numpy as np
+        from app.service.audio_pipeline import find_segment_cut
+
+        super().feed(chunk)
+        self._buffer += chunk
+        while len(self._buffer) >= self._max_bytes:
+            samples = np.frombuffer(bytes(self._buffer[:self._max_bytes]), dtype=np.int16)
+            cut, quiet = find_segment_cut(samples, self.sample_rate_hertz, SEGMENT_SEARCH_SECONDS)
+            self._submit(bytes(self._buffer[:cut * 2]))
+            # The overlap never takes back more than half a segment, so each cut makes progress
+            overlap = min(int(SEGMENT_OVERLAP_SECONDS * self.sample_rate_hertz), cut // 2)
+            next_start = cut if quiet else cut - overlap
+            del self._buffer[:next_start * 2]
+            self._overlap_next = not quiet
+
+    async def finish(self) -> str:
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        texts = await stt_executor.wait(asyncio.gather(*(future for future, _ in self._segments)))
+        print(f"Transcribed {len(texts)} segment(s) in parallel.")
+        return stitch_transcripts([(text, overlaps) for text, (_, overlaps) in zip(texts, self._segments)])
+
+    def abort(self):
+        # Segments not yet picked up by a worker are dropped
+        for future, _ in self._segments:
+            future.cancel()
+
+
+def _local_transcribe_segment(audio_content: bytes, sample_rate_hertz: int) -> str:
+    return os.getenv('LOCAL_STT_TRANSCRIPT', '')
+
+
+def create_recognizer(sample_rate_hertz: int | None = 16000, long_audio: bool = False,
+                      encoding: str = "LINEAR16") -> StreamingRecognizer:
+    """Long-audio mode takes LINEAR16 only; streaming also accepts FLAC, OGG_OPUS and WEBM_OPUS."""
+    if long_audio:
+        transcribe_segment = _local_transcribe_segment if STT_BACKEND == 'local' else transcribe_short_audio_sync
+        return LongAudioRecognizer(sample_rate_hertz, transcribe_segment)
+    if STT_BACKEND == 'local':
+        return LocalStreamingRecognizer(sample_rate_hertz, encoding)
+    return GoogleStreamingRecognizer(sample_rate_hertz, encoding)
+
 # =================================================================
 # === TEST EXECUTION BLOCK (MAKES IT RUN) ==========================
 # =================================================================
@@ -0,0 +1,249 @@
+import asyncio
+import math
+import os
+import re
+import struct
+from collections import OrderedDict
+
+# "translate" is the endpoint the firmware used to call itself (MP3 only),
+# "google" is Cloud Text-to-Speech (needs google-cloud-texttospeech and the
+# service key), "local" is an offline stand-in that renders tones
+TTS_BACKEND = os.getenv('TTS_BACKEND', 'translate').lower()
+TTS_VOICE = os.getenv('TTS_VOICE', 'en-US-Standard-C')
+TTS_SAMPLE_RATE = 16000
+TTS_CACHE_BYTES = int(os.getenv('TTS_CACHE_BYTES', str(16 * 1024 * 1024)))
+# The translate endpoint rejects text much longer than this
+TRANSLATE_MAX_CHARS = 200
+
+# Played once in place of the sentences of a reply that fail to synthesize
+TTS_FALLBACK_REPLY = "Sorry, I lost my voice for a moment."
+
+MEDIA_TYPES = {"pcm": f"audio/L16;rate={TTS_SAMPLE_RATE};channels=1", "mp3": "audio/mpeg"}
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def normalize_tts_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def split_sentences(text: str) -> list:
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text.strip()) if sentence]
+
+def _strip_wav_header(audio: bytes) -> bytes:
+    """Cloud TTS wraps LINEAR16 in a WAV header; return only the samples."""
+    if audio[:4] != b"RIFF":
+        return audio
+    offset = 12
+    while offset + 8 <= len(audio):
+        chunk_id, size = struct.unpack("<4sI", audio[offset:offset + 8])
+        if chunk_id == b"data":
+            return audio[offset + 8:offset + 8 + size]
+        offset += 8 + size
+    return audio
+
+
+class Synthesizer:
+    """Turns one sentence into audio. synthesize() blocks; it runs in a worker thread."""
+
+    formats = ("pcm", "mp3")
+
+    def synthesize(self, text: str, voice: str, audio_format: str) -> bytes:
+        raise NotImplementedError
+
+
+class TranslateSynthesizer(Synthesizer):
+    formats = ("mp3",)
+
+    def __init__(self):
+        import requests
+        self._session = requests.Session()
+
+    def synthesize(self, text: str, voice: str, audio_format: str) -> bytes:
+        # The voice's language prefix ("en" from "en-US-Standard-C") picks the accent
+        response = self._session.get(
+            "http://translate.google.com/translate_tts",
+            params={"ie": "UTF-8", "q": text[:TRANSLATE_MAX_CHARS], "tl": voice.split("-")[0], "client": "tw-ob"},
+            timeout=10
+        )
+        response.raise_for_status()
+        return response.content
+
+
+class GoogleSynthesizer(Synthesizer):
+    def __init__(self):
+        from google.cloud import texttospeech
+        self._tts = texttospeech
+        self._client = texttospeech.TextToSpeechClient()
+
+    def synthesize(self, text: str, voice: str, audio_format: str) -> bytes:
+        tts = self._tts
+        response = self._client.synthesize_speech(
+            input=tts.SynthesisInput(text=text),
+            voice=tts.VoiceSelectionParams(language_code="-".join(voice.split("-")[:2]), name=voice),
+            audio_config=tts.AudioConfig(
+                audio_encoding=tts.AudioEncoding.MP3 if audio_format == "mp3" else tts.AudioEncoding.LINEAR16,
+                sample_rate_hertz=TTS_SAMPLE_RATE
+            )
+        )
+        return response.audio_content if audio_format == "mp3" else _strip_wav_header(response.audio_content)
+
+
+class LocalSynthesizer(Synthesizer):
+    """Offline stand-in: a short quiet tone per word, as 16kHz PCM."""
+
+    formats = ("pcm",)
+
+    def synthesize(self, text: str, voice: str, audio_format: str) -> bytes:
+        samples = []
+        for _ in text.split():
+            samples += [int(3000 * math.sin(2 * math.pi * 440 * i / TTS_SAMPLE_RATE)) for i in range(TTS_SAMPLE_RATE // 5)]
+            samples += [0] * (TTS_SAMPLE_RATE // 20)
+        return struct.pack(f"<{len(samples)}h", *samples)
+
+
+def create_synthesizer() -> Synthesizer:
+    if TTS_BACKEND == 'google':
+        return GoogleSynthesizer()
+    if TTS_BACKEND == 'local':
+        return LocalSynthesizer()
+    return TranslateSynthesizer()
+
+
+class AudioCache:
+    """LRU of synthesized sentences, bounded by total audio bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: tuple) -> bytes | None:
+        audio = self._entries.get(key)
+        if audio is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return audio
+
+    def put(self, key: tuple, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        if key in self._entries:
+            self.bytes -= len(self._entries.pop(key))
+        self._entries[key] = audio
+        self.bytes += len(audio)
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+_synthesizer: Synthesizer = None
+audio_cache = AudioCache(TTS_CACHE_BYTES)
+# Fixed replies rendered ahead of time in the default voice and kept out of the
+# LRU, so they still play while synthesis is failing
+_prerendered = {}
+
+def get_synthesizer() -> Synthesizer:
+    global _synthesizer
+    if _synthesizer is None:
+        _synthesizer = create_synthesizer()
+    return _synthesizer
+
+def resolve_format(requested: str | None) -> str:
+    """The requested format if the synthesizer produces it, else its first one."""
+    formats = get_synthesizer().formats
+    return requested if requested in formats else formats[0]
+
+async def prerender(texts: list):
+    """Render fixed replies in every format the synthesizer produces. Started from the app lifespan."""
+    try:
+        synthesizer = await asyncio.to_thread(get_synthesizer)
+    except Exception as e:
+        print(f"Could not pre-render fixed replies: {e}")
+        return
+    for text in texts:
+        for audio_format in synthesizer.formats:
+            key = (normalize_tts_text(text), audio_format)
+            if key in _prerendered:
+                continue
+            try:
+                _prerendered[key] = await synthesize_sentence(text, TTS_VOICE, audio_format)
+            except Exception as e:
+                print(f"Could not pre-render \"{text}\": {e}")
+
+def prerendered(text: str, audio_format: str) -> bytes | None:
+    return _prerendered.get((normalize_tts_text(text), audio_format))
+
+async def synthesize_sentence(text: str, voice: str = TTS_VOICE, audio_format: str = "pcm") -> bytes:
+    if voice == TTS_VOICE and prerendered(text, audio_format) is not None:
+        return prerendered(text, audio_format)
+    key = (normalize_tts_text(text), voice, audio_format)
+    audio = audio_cache.get(key)
+    if audio is None:
+        audio = await asyncio.get_running_loop().run_in_executor(
+            None, get_synthesizer().synthesize, text, voice, audio_format
+        )
+        audio_cache.put(key, audio)
+    return audio
+
+async def synthesize_stream(sentences, voice: str = TTS_VOICE, audio_format: str = "pcm"):
+    """
+    Yield audio sentence by sentence. `sentences` is a list or an async
+    iterator (e.g. an agent reply still being generated); each sentence
+    starts synthesizing as soon as it is known, and audio is yielded in order.
+    A sentence that fails to synthesize is replaced by the pre-rendered
+    TTS_FALLBACK_REPLY (once per reply) instead of cutting the stream off.
+    """
+    async def sentence_source():
+        if hasattr(sentences, "__aiter__"):
+            async for sentence in sentences:
+                yield sentence
+        else:
+            for sentence in sentences:
+                yield sentence
+
+    pending = asyncio.Queue()
+
+    async def schedule():
+        try:
+            async for sentence in sentence_source():
+                if sentence.strip():
+                    pending.put_nowait(asyncio.ensure_future(synthesize_sentence(sentence, voice, audio_format)))
+        finally:
+            pending.put_nowait(None)
+
+    scheduler = asyncio.ensure_future(schedule())
+    apologized = False
+    try:
+        while True:
+            task = await pending.get()
+            if task is None:
+                break
+            try:
+                audio = await task
+            except Exception as e:
+                print(f"Synthesis failed; skipping the sentence: {e}")
+                audio = b"" if apologized else prerendered(TTS_FALLBACK_REPLY, audio_format) or b""
+                apologized = True
+            if audio:
+                yield audio
+        await scheduler
+    finally:
+        scheduler.cancel()
+        while not pending.empty():
+            task = pending.get_nowait()
+            if task:
+                task.cancel()
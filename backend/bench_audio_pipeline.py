@@ -0,0 +1,71 @@
+# Throughput and peak memory of device audio preprocessing on the recorded samples in test/.
+#
+#   python bench_audio_pipeline.py              # 4096-byte chunks (a few ESP32 reads per HTTP chunk)
+#   python bench_audio_pipeline.py --chunk 1024
+
+import sys
+import os
+import time
+import tracemalloc
+import wave
+import numpy as np
+from app.service.audio_pipeline import AudioPreprocessor
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test")
+ROUNDS = 20
+
+def whole_buffer_downmix(audio_bytes: bytes) -> bytes:
+    """The previous device.py path: buffer everything, then downmix via int32 copies."""
+    samples = np.frombuffer(audio_bytes, dtype=np.int16)
+    if len(samples) % 2 != 0:
+        samples = samples[:-1]
+    left = samples[0::2]
+    right = samples[1::2]
+    mono = ((left.astype(np.int32) + right.astype(np.int32)) // 2).astype(np.int16)
+    return mono.tobytes()
+
+def stereo_upload(path: str) -> tuple:
+    """A sample as the old code assumed the device sent it: interleaved stereo at the file's rate."""
+    with wave.open(path) as wav:
+        rate = wav.getframerate()
+        mono = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    return np.repeat(mono, 2).tobytes(), rate, len(mono) / rate
+
+def measure(run) -> tuple:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        run()
+    elapsed = (time.perf_counter() - start) / ROUNDS
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    chunk_size = int(sys.argv[sys.argv.index("--chunk") + 1]) if "--chunk" in sys.argv else 4096
+    print(f"{'sample':<12} {'audio s':>8} {'mode':<10} {'ms':>8} {'x realtime':>11} {'peak KB':>9} {'peak/audio':>11}")
+
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        if not name.endswith(".wav"):
+            continue
+        upload, rate, seconds = stereo_upload(os.path.join(SAMPLES_DIR, name))
+        view = memoryview(upload)
+
+        def chunked():
+            preprocessor = AudioPreprocessor(layout="auto", input_rate=rate, output_rate=16000)
+            for offset in range(0, len(view), chunk_size):
+                preprocessor.process(view[offset:offset + chunk_size])
+            preprocessor.flush()
+
+        for mode, run in (("whole", lambda: whole_buffer_downmix(upload)), ("chunked", chunked)):
+            elapsed, peak = measure(run)
+            print(f"{name:<12} {seconds:>8.2f} {mode:<10} {elapsed * 1000:>8.2f} {seconds / elapsed:>11.0f} "
+                  f"{peak / 1024:>9.1f} {peak / len(upload):>11.2f}")
+
+    print("\n'whole' only downmixes (no resample/gain) and needs the full upload first;"
+          " 'chunked' also resamples to 16kHz, trims silence and normalizes gain as chunks arrive.")
+
+if __name__ == "__main__":
+    main()
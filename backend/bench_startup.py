@@ -0,0 +1,86 @@
+# Cold-start time of the backend: importing app.main and each router, and running the lifespan.
+#
+#   python bench_startup.py              # 5 fresh interpreters per measurement
+#   python bench_startup.py --runs 10
+#   python bench_startup.py --heavy      # also check which slow libraries each import loads
+#
+# Every measurement runs in a new interpreter, so nothing is already imported.
+# The lifespan needs MONGODB_URI; without a reachable database it reports the error instead.
+
+import json
+import statistics
+import subprocess
+import sys
+import os
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES = [
+    "app.database",
+    "app.api.auth",
+    "app.api.calendar",
+    "app.api.gmail",
+    "app.api.gmail_webhook",
+    "app.api.digest",
+    "app.api.device",
+    "app.main",
+]
+# Libraries that should only load when a request first needs them
+HEAVY_MODULES = ["numpy", "google.cloud.speech", "googleapiclient.discovery", "google_auth_oauthlib", "grpc"]
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+LIFESPAN_PROBE = """
+import asyncio, json, time
+from app.main import app
+
+async def run():
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter() - start
+    return ready, time.perf_counter() - start - ready
+
+try:
+    startup, shutdown = asyncio.run(run())
+    print(json.dumps({"startup": startup, "shutdown": shutdown}))
+except Exception as e:
+    print(json.dumps({"error": f"{type(e).__name__}: {e}"}))
+"""
+
+def probe(code: str) -> dict:
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        error = (result.stderr.strip().splitlines() or ["exited without output"])[-1]
+        return {"error": error}
+    return json.loads(lines[-1])
+
+def main():
+    runs = int(sys.argv[sys.argv.index("--runs") + 1]) if "--runs" in sys.argv else 5
+    show_heavy = "--heavy" in sys.argv
+
+    print(f"{'import':<24} {'median ms':>10} {'min ms':>8}" + ("  heavy modules loaded" if show_heavy else ""))
+    for module in MODULES:
+        samples = [probe(IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)) for _ in range(runs)]
+        failed = next((sample for sample in samples if "error" in sample), None)
+        if failed:
+            print(f"{module:<24} failed: {failed['error']}")
+            continue
+        seconds = [sample["seconds"] for sample in samples]
+        heavy = ", ".join(samples[0]["heavy"]) or "-"
+        print(f"{module:<24} {statistics.median(seconds) * 1000:>10.1f} {min(seconds) * 1000:>8.1f}"
+              + (f"  {heavy}" if show_heavy else ""))
+
+    result = probe(LIFESPAN_PROBE)
+    if "error" in result:
+        print(f"\nlifespan failed: {result['error']}")
+    else:
+        print(f"\nlifespan startup {result['startup'] * 1000:.1f} ms, shutdown {result['shutdown'] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
 import React, { useState, useRef } from "react";
 import { Mic, StopCircle, Loader2, Settings, Volume2, Trash2 } from "lucide-react";
 
+// Stable per-browser id, so the backend keeps this browser's conversation and
+// lets a new recording replace one still in flight
+function getDeviceId() {
+  let deviceId = localStorage.getItem("deviceId");
+  if (!deviceId) {
+    deviceId = window.crypto?.randomUUID
+      ? window.crypto.randomUUID()
+      : Math.random().toString(36).slice(2) + Date.now().toString(36);
+    localStorage.setItem("deviceId", deviceId);
+  }
+  return `web:${deviceId}`;
+}
+
 export default function VoiceAssistant() {
   const [recording, setRecording] = useState(false);
   const [audioURL, setAudioURL] = useState(null);
@@ -50,7 +63,8 @@ export default function VoiceAssistant() {
       mediaRecorder.onstop = async () => {
         stream.getTracks().forEach(track => track.stop());
         
-        const blob = new Blob(audioChunksRef.current, { type: config.audioFormat });
+        // Keep the recorder's own (compressed) type, e.g. audio/webm;codecs=opus
+        const blob = new Blob(audioChunksRef.current, { type: mediaRecorder.mimeType || config.audioFormat });
         const url = URL.createObjectURL(blob);
         setAudioURL(url);
 
@@ -78,39 +92,15 @@ export default function VoiceAssistant() {
     try {
       setLoading(true);
       
-      // Convert blob to AudioBuffer for proper PCM conversion
-      const arrayBuffer = await blob.arrayBuffer();
-      const audioContext = new (window.AudioContext || window.webkitAudioContext)();
-      const audioBuffer = await audioContext.decodeAudioData(arrayBuffer);
-      
-      // Convert to mono if stereo
-      let channelData;
-      if (audioBuffer.numberOfChannels === 2) {
-        // Average the two channels
-        const left = audioBuffer.getChannelData(0);
-        const right = audioBuffer.getChannelData(1);
-        channelData = new Float32Array(left.length);
-        for (let i = 0; i < left.length; i++) {
-          channelData[i] = (left[i] + right[i]) / 2;
-        }
-      } else {
-        channelData = audioBuffer.getChannelData(0);
-      }
-      
-      // Convert float32 samples to int16 PCM
-      const pcmData = new Int16Array(channelData.length);
-      for (let i = 0; i < channelData.length; i++) {
-        // Clamp to [-1, 1] and convert to int16
-        const s = Math.max(-1, Math.min(1, channelData[i]));
-        pcmData[i] = s < 0 ? s * 0x8000 : s * 0x7FFF;
-      }
-      
+      // The backend decodes compressed uploads (or passes Opus/FLAC straight to STT),
+      // so the recording is sent as-is instead of as much larger raw PCM
       const res = await fetch(config.apiEndpoint, {
         method: "POST",
         headers: {
-          "Content-Type": "application/octet-stream",
+          "Content-Type": blob.type || "application/octet-stream",
+          "X-Device-Id": getDeviceId(),
         },
-        body: pcmData.buffer,
+        body: blob,
       });
       
       if (!res.ok) {